@@ -0,0 +1,374 @@
+"""Нагрузочный прогон бота против фейкового Bot API.
+
+Засевает N пользователей и M напоминаний в базу из DATABASE_URL (по умолчанию — файл SQLite рядом,
+для сравнения можно указать локальный Postgres),
+прогоняет синтетические webhook-апдейты (/list, создание, правка, удаление, /import CSV) через create_app() и тик reminder_cleaner,
+результаты пишет в JSON:
+
+    python benchmark.py --users 50 --sizes 1000,10000,100000 --due 500 --output bench.json
+
+ВНИМАНИЕ: таблицы в базе пересоздаются.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("APP_URL", "http://localhost")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///benchmark.db")
+# апдейты идут подряд без пауз, а прогоны повторяют тех же пользователей — лимиты флуда исказили бы замеры
+os.environ.setdefault("FLOOD_GLOBAL_RATE", "0")
+os.environ.setdefault("FLOOD_USER_RATE", "0")
+
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetFile
+from aiogram.types import Chat, File, Message
+from aiohttp.test_utils import TestClient, TestServer
+from sqlalchemy import event, insert, select
+
+import main
+from migrations import migrate
+from database import Base, Reminder, User, engine, user_cache, list_cache
+
+USER_ID_BASE = 10_000_000
+
+
+class FakeSession(BaseSession):
+    # записывает все вызовы Bot API вместо похода в Telegram
+    def __init__(self, latency: float = 0.0, import_file: bytes = b""):
+        super().__init__()
+        self.latency = latency
+        self.import_file = import_file  # содержимое любого файла, который скачивает /import
+        self.calls = []  # (method, monotonic time, duration)
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls.append((type(method).__name__, time.monotonic(), time.perf_counter() - started))
+        if method.__returning__ is bool:
+            return True
+        if isinstance(method, GetFile):
+            return File(file_id=method.file_id, file_unique_id=method.file_id, file_path="documents/bench.csv")
+        self._message_id += 1
+        return Message(
+            message_id=self._message_id,
+            date=datetime.now(timezone.utc),
+            chat=Chat(id=getattr(method, "chat_id", 0) or 0, type="private"),
+            text=getattr(method, "text", None)
+        )
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        # скачивание кусками, как у AiohttpSession
+        for offset in range(0, len(self.import_file), chunk_size):
+            yield self.import_file[offset:offset + chunk_size]
+
+    async def close(self):
+        pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.5),
+        "p99": percentile(values, 0.99),
+        "mean": statistics.fmean(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+        self.message_id = 0
+
+    def _next(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    def message(self, telegram_id: int, text: str):
+        update_id, message_id = self._next()
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "from": {"id": telegram_id, "is_bot": False, "first_name": "bench"},
+                "text": text,
+            },
+        }
+
+    def document(self, telegram_id: int, caption: str, file_name: str, file_size: int):
+        update_id, message_id = self._next()
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "from": {"id": telegram_id, "is_bot": False, "first_name": "bench"},
+                "caption": caption,
+                "document": {
+                    "file_id": f"bench{update_id}",
+                    "file_unique_id": f"bench{update_id}",
+                    "file_name": file_name,
+                    "file_size": file_size,
+                },
+            },
+        }
+
+    def callback(self, telegram_id: int, data: str, message_id: int = 1):
+        update_id, _ = self._next()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": {"id": telegram_id, "is_bot": False, "first_name": "bench"},
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": telegram_id, "type": "private"},
+                    "text": "bench",
+                },
+            },
+        }
+
+
+async def first_reminder_id(telegram_id: int):
+    # id для кнопок выбора; запрос вне замеров — сами апдейты считаются отдельно
+    async with engine.connect() as conn:
+        return await conn.scalar(
+            select(Reminder.id).join(User, Reminder.user_id == User.id)
+            .where(User.telegram_id == telegram_id)
+            .order_by(Reminder.reminder_time, Reminder.id).limit(1)
+        )
+
+
+def import_csv(rows: int) -> bytes:
+    start = datetime.now(timezone.utc) + timedelta(days=60)
+    lines = ["title,time,message,repeat"] + [
+        f"imported {i},{(start + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M')},bench import,"
+        for i in range(rows)
+    ]
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def flows(factory: UpdateFactory, telegram_id: int, import_size: int):
+    future = (datetime.now(timezone.utc) + timedelta(days=30)).strftime("%Y-%m-%d %H:%M")
+    yield "list", [factory.message(telegram_id, "/list")]
+    yield "create", [
+        factory.callback(telegram_id, "create"),
+        factory.message(telegram_id, "Bench"),
+        factory.message(telegram_id, future),
+        factory.message(telegram_id, "benchmark reminder"),
+        factory.callback(telegram_id, "repeat:once"),
+    ]
+    yield "edit", [
+        factory.callback(telegram_id, "pick:edit:at:"),
+        factory.callback(telegram_id, f"edit:{await first_reminder_id(telegram_id)}:"),
+        factory.message(telegram_id, "Edited"),
+        factory.message(telegram_id, future),
+        factory.message(telegram_id, "edited reminder"),
+        factory.callback(telegram_id, "repeat:keep"),
+    ]
+    yield "delete", [
+        factory.callback(telegram_id, "pick:delete:at:"),
+        factory.callback(telegram_id, f"del:{await first_reminder_id(telegram_id)}:"),
+    ]
+    if import_size:
+        yield "import", [factory.document(telegram_id, "/import", "bench.csv", import_size)]
+
+
+async def reset_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await migrate()
+    user_cache.clear()
+    list_cache.clear()
+
+
+async def seed(users: int, reminders: int, chunk: int = 5000):
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {"telegram_id": USER_ID_BASE + i, "timezone": "0"} for i in range(users)
+        ])
+    for offset in range(0, reminders, chunk):
+        rows = []
+        for i in range(offset, min(offset + chunk, reminders)):
+            when = now + timedelta(minutes=10 + i)
+            rows.append({
+                "user_id": i % users + 1,
+                "title": f"r{i}",
+                "reminder_time": when,
+                "next_attempt_at": when,
+                "message": "seeded",
+            })
+        async with engine.begin() as conn:
+            await conn.execute(insert(Reminder), rows)
+
+
+async def seed_due(users: int, due: int):
+    # все просроченные напоминания наступили в один момент — от него и считаем lag
+    due_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    async with engine.begin() as conn:
+        await conn.execute(insert(Reminder), [
+            {
+                "user_id": i % users + 1,
+                "title": f"due{i}",
+                "reminder_time": due_at,
+                "next_attempt_at": due_at,
+                "message": "due",
+            }
+            for i in range(due)
+        ])
+    return due_at
+
+
+async def replay_updates(client: TestClient, factory: UpdateFactory, users: int, counter: QueryCounter, done: dict, import_size: int):
+    ack, handling, queries, checkouts = {}, {}, {}, {}
+    for i in range(users):
+        async for flow, updates in flows(factory, USER_ID_BASE + i, import_size):
+            for update in updates:
+                finished = asyncio.Event()
+                done[update["update_id"]] = finished
+                queries_before = counter.count
+                checkouts_before = engine.pool.checkouts
+                started = time.perf_counter()
+                response = await client.post(main.WEBHOOK_PATH, json=update)
+                ack.setdefault(flow, []).append(time.perf_counter() - started)
+                await response.release()
+                await asyncio.wait_for(finished.wait(), timeout=30)
+                handling.setdefault(flow, []).append(time.perf_counter() - started)
+                queries.setdefault(flow, []).append(counter.count - queries_before)
+                checkouts.setdefault(flow, []).append(engine.pool.checkouts - checkouts_before)
+    return {
+        flow: {
+            "ack": summarize(ack[flow]),
+            "handling": summarize(handling[flow]),
+            "queries_per_update": statistics.fmean(queries[flow]),
+            "pool_checkouts_per_update": statistics.fmean(checkouts[flow]),
+        }
+        for flow in ack
+    }
+
+
+async def run_cleaner_tick(session: FakeSession, counter: QueryCounter, due_at: datetime, due: int):
+    calls_before = len(session.calls)
+    queries_before = counter.count
+    started = time.monotonic()
+    await main.deliver_due_reminders(main.pipeline)
+    claimed = time.monotonic()
+    await main.pipeline.queue.join()
+    finished = time.monotonic()
+    sends = [call for call in session.calls[calls_before:] if call[0] == "SendMessage"]
+    offset = datetime.now(timezone.utc).timestamp() - time.monotonic()
+    lags = [sent_at + offset - due_at.timestamp() for _, sent_at, _ in sends]
+    return {
+        "due": due,
+        "delivered": len(sends),
+        "claim_seconds": claimed - started,
+        "tick_seconds": finished - started,
+        "queries": counter.count - queries_before,
+        "delivery_lag": summarize(lags),
+    }
+
+
+async def run(args):
+    session = FakeSession(latency=args.api_latency, import_file=import_csv(args.import_rows))
+    main.bot.session = session
+    counter = QueryCounter()
+    done = {}
+
+    async def track_update(handler, update, data):
+        try:
+            return await handler(update, data)
+        finally:
+            finished = done.pop(update.update_id, None)
+            if finished:
+                finished.set()
+
+    main.dp.update.outer_middleware(track_update)
+
+    async def idle_cleaner(pipeline):
+        # тик reminder_cleaner гоняем вручную, чтобы мерить его отдельно
+        await asyncio.Event().wait()
+
+    main.reminder_cleaner = idle_cleaner
+    await reset_db()
+
+    client = TestClient(TestServer(main.create_app()))
+    await client.start_server()
+    results = []
+    # одна фабрика на все прогоны: повторный update_id отбросила бы дедупликация вебхука
+    factory = UpdateFactory()
+    try:
+        for size in args.sizes:
+            await reset_db()
+            await seed(args.users, size)
+            print(f"[Bench] {size} reminders: replaying updates for {args.users} users")
+            webhook = await replay_updates(client, factory, args.users, counter, done, len(session.import_file))
+            due_at = await seed_due(args.users, args.due)
+            print(f"[Bench] {size} reminders: delivering {args.due} due reminders")
+            cleaner = await run_cleaner_tick(session, counter, due_at, args.due)
+            results.append({"reminders": size, "webhook": webhook, "cleaner": cleaner})
+    finally:
+        await client.close()
+
+    api_latency = [duration for _, _, duration in session.calls]
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "database": engine.url.get_backend_name(),
+        "users": args.users,
+        "due": args.due,
+        "api_latency": args.api_latency,
+        "bot_api_calls": len(session.calls),
+        "bot_api_call_latency": summarize(api_latency),
+        "runs": results,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reminder bot benchmark")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 10000])
+    parser.add_argument("--due", type=int, default=100)
+    parser.add_argument("--import-rows", type=int, default=100, help="строк в CSV для /import, 0 — без импорта")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="искусственная задержка Bot API, сек")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -1,11 +1,94 @@
 from dotenv import load_dotenv
 import os
+import socket
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 APP_URL = os.getenv("APP_URL")
 DATABASE_URL = os.getenv("DATABASE_URL")
+# необязательная реплика для чтения списков и поиска напоминаний
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+CLEANER_BATCH_SIZE = int(os.getenv("CLEANER_BATCH_SIZE", 500))
+SCHEDULER_HORIZON = float(os.getenv("SCHEDULER_HORIZON", 3600))
+SCHEDULER_RESYNC_INTERVAL = float(os.getenv("SCHEDULER_RESYNC_INTERVAL", 60))
+
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", 8))
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", 1000))
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", 30))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", 1))
+DELIVERY_CHAT_BURST = int(os.getenv("DELIVERY_CHAT_BURST", 3))
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", 3))
+# попытки между тиками: после DELIVERY_MAX_ATTEMPTS напоминание уходит в failed_reminders
+DELIVERY_MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", 5))
+DELIVERY_BACKOFF_BASE = float(os.getenv("DELIVERY_BACKOFF_BASE", 60))
+DELIVERY_BACKOFF_MAX = float(os.getenv("DELIVERY_BACKOFF_MAX", 3600))
+
+# имя реплики, которой принадлежат захваченные напоминания
+WORKER_ID = os.getenv("WORKER_ID") or os.getenv("DYNO") or f"{socket.gethostname()}:{os.getpid()}"
+CLAIM_LEASE_SECONDS = float(os.getenv("CLAIM_LEASE_SECONDS", 300))
+
+REGISTRATION_CACHE_SIZE = int(os.getenv("REGISTRATION_CACHE_SIZE", 50_000))
+REGISTRATION_CACHE_TTL = float(os.getenv("REGISTRATION_CACHE_TTL", 600))
+REGISTRATION_CACHE_NEGATIVE_TTL = float(os.getenv("REGISTRATION_CACHE_NEGATIVE_TTL", 10))
+
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", 10))
+# кеш отрисованного списка: инвалидируется при записи; TTL ограничивает устаревание между репликами
+LIST_CACHE_SIZE = int(os.getenv("LIST_CACHE_SIZE", 10_000))
+LIST_CACHE_TTL = float(os.getenv("LIST_CACHE_TTL", 300))
+LIST_CACHE_PAGES = int(os.getenv("LIST_CACHE_PAGES", 8))
+
+# memory | database | redis
+FSM_STORAGE = os.getenv("FSM_STORAGE", "database")
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", 86400))
+FSM_PURGE_INTERVAL = float(os.getenv("FSM_PURGE_INTERVAL", 600))
+REDIS_URL = os.getenv("REDIS_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", DB_POOL_SIZE))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+# для pgbouncer в режиме transaction pooling выставить 0
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+
+# read-your-writes: столько секунд после записи чтения пользователя идут на primary
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", 10))
+# отставание реплики, сек, после которого чтения возвращаются на primary
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 10))
+
+# queue — ограниченная очередь с воркерами; simple — SimpleRequestHandler из aiogram как есть
+WEBHOOK_INGESTION = os.getenv("WEBHOOK_INGESTION", "queue")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 8))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", 10_000))
+
+# защита от флуда: апдейты сверх лимита отбрасываются до открытия сессии БД; rate 0 — без ограничения
+FLOOD_USER_RATE = float(os.getenv("FLOOD_USER_RATE", 2))
+FLOOD_USER_BURST = int(os.getenv("FLOOD_USER_BURST", 20))
+FLOOD_GLOBAL_RATE = float(os.getenv("FLOOD_GLOBAL_RATE", 200))
+FLOOD_GLOBAL_BURST = int(os.getenv("FLOOD_GLOBAL_BURST", 400))
+FLOOD_MAX_USERS = int(os.getenv("FLOOD_MAX_USERS", 100_000))
+
+# окно дайджеста по умолчанию, сек: напоминания одного чата, наступающие в пределах окна
+# от первого просроченного, уходят одним сообщением; 0 — каждое отдельно
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", 0))
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 500))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", 10_000))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", 20 * 1024 * 1024))  # лимит getFile в Bot API
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# уровни отдельных логгеров: "aiogram=WARNING,delivery=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "aiogram.event=WARNING")
+# доля попадающих в лог записей по отдельным напоминаниям
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+# json | text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN not found!")
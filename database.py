@@ -1,28 +1,237 @@
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
-from sqlalchemy.orm import declarative_base, relationship, selectinload
-from sqlalchemy import Column, Integer, String, DateTime, select, delete, ForeignKey, BigInteger
-from datetime import datetime, timezone
-from typing import List, Dict, Any
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.dialects.postgresql import TIMESTAMP
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, relationship
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, select, delete, update, insert, func, ForeignKey, BigInteger, text, tuple_, event
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Callable, List, Dict, Any, NamedTuple, Optional
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import await_only
 
+import asyncio
+import inspect
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 import pytz
-import os
+import time
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_async_engine(DATABASE_URL, echo=False)
+from cache import TTLCache
+from recurrence import next_occurrence
+from config import (
+    DATABASE_URL, DATABASE_REPLICA_URL, REPLICA_STICKY_SECONDS, REPLICA_MAX_LAG, REGISTRATION_CACHE_SIZE, REGISTRATION_CACHE_TTL, REGISTRATION_CACHE_NEGATIVE_TTL,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT_MS, DB_STATEMENT_CACHE_SIZE, DIGEST_WINDOW, LIST_CACHE_SIZE, LIST_CACHE_TTL
+)
+
+logger = logging.getLogger("database")
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # сколько запросы ждут свободное соединение из пула; счётчики свои у каждого пула — primary и реплики
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.checkout_wait_total += waited
+            self.checkout_wait_max = max(self.checkout_wait_max, waited)
+
+def engine_options(url: str) -> Dict[str, Any]:
+    options = {
+        "echo": False,
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if make_url(url).get_driver_name() == "asyncpg":
+        connect_args = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        options["connect_args"] = connect_args
+    return options
+
+# WAL: читатели не блокируют писателя; synchronous=NORMAL в WAL не теряет целостность, fsync только на чекпоинте
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": -20000,  # ~20 МБ страничного кэша на соединение
+    "mmap_size": 128 * 1024 * 1024,
+}
+
+# у SQLite один писатель на файл: пишущие транзакции процесса ждут здесь своей очереди,
+# а не упираются в busy_timeout и "database is locked"
+sqlite_writer = asyncio.Lock()
+
+class SQLiteSyncSession(Session):
+    # блокировку берут хуки ниже перед первой записью транзакции — DML, SELECT ... FOR UPDATE или flush,
+    # в том числе autoflush внутри get() и запросов; держится до конца транзакции.
+    # чтения вне пишущей транзакции в WAL идут параллельно
+    pass
+
+def _acquire_writer(session: Session):
+    if session.info.get("writer"):
+        return
+    # сначала соединение, потом блокировка: держатель блокировки не должен ждать свободного соединения
+    session.connection()
+    await_only(sqlite_writer.acquire())
+    session.info["writer"] = True
+
+@event.listens_for(SQLiteSyncSession, "do_orm_execute")
+def _lock_before_write(orm_execute_state):
+    if (
+        orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete
+        or getattr(orm_execute_state.statement, "_for_update_arg", None) is not None
+    ):
+        _acquire_writer(orm_execute_state.session)
+
+@event.listens_for(SQLiteSyncSession, "before_flush")
+def _lock_before_flush(session, flush_context, instances):
+    _acquire_writer(session)
+
+@event.listens_for(SQLiteSyncSession, "after_transaction_end")
+def _release_writer(session, transaction):
+    # коммит, откат или закрытие внешней транзакции; точки сохранения блокировку не отпускают
+    if transaction.parent is None and session.info.pop("writer", False):
+        sqlite_writer.release()
+
+engine = create_async_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+IS_SQLITE = engine.dialect.name == "sqlite"
 async_session = async_sessionmaker(
     bind=engine,
+    sync_session_class=SQLiteSyncSession if IS_SQLITE else Session,
     expire_on_commit=False
 )
 
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+if IS_SQLITE:
+    event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+
+class Replica:
+    # реплика только для чтения; при ошибке или большом отставании чтения уходят на primary
+    # до следующей удачной проверки (replica_monitor в main.py)
+    def __init__(self, url: str, max_lag: float):
+        self.engine = create_async_engine(url, **engine_options(url))
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine.sync_engine, "connect", set_sqlite_pragmas)
+        self.session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.max_lag = max_lag
+        self.healthy = True
+        self.lag = 0.0
+        self.reads = 0
+        self.fallbacks = 0
+
+    def mark_unhealthy(self, reason: str):
+        if self.healthy:
+            logger.warning("Replica marked unhealthy", extra={"reason": reason})
+        self.healthy = False
+
+    async def check(self):
+        try:
+            async with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    # на простаивающем primary время последней транзакции стареет, а данные актуальны
+                    lag = await conn.scalar(text(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    ))
+                else:
+                    await conn.execute(text("SELECT 1"))
+                    lag = 0
+        except Exception as e:
+            self.mark_unhealthy(str(e))
+            return
+        self.lag = float(lag or 0)
+        if self.lag > self.max_lag:
+            self.mark_unhealthy(f"lag {self.lag:.1f}s")
+            return
+        if not self.healthy:
+            logger.info("Replica is healthy again", extra={"lag": self.lag})
+        self.healthy = True
+
+replica = Replica(DATABASE_REPLICA_URL, REPLICA_MAX_LAG) if DATABASE_REPLICA_URL else None
+
+# сессия текущего апдейта (см. unit_of_work); её же использует FSM-хранилище
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_session", default=None)
+
+# user_id -> True, пока чтения пользователя должны видеть его недавние записи (см. _reader);
+# память процесса: апдейт, попавший на другой dyno, этой защиты не получает
+recent_writers = TTLCache(REGISTRATION_CACHE_SIZE, REPLICA_STICKY_SECONDS)
+# telegram_id -> UserContext, либо False для незарегистрированных
+user_cache = TTLCache(REGISTRATION_CACHE_SIZE, REGISTRATION_CACHE_TTL)
+# user_id -> {(start, before): (текст списка, ReminderPage)}; сбрасывается любой записью в напоминания пользователя
+list_cache = TTLCache(LIST_CACHE_SIZE, LIST_CACHE_TTL)
+
 Base = declarative_base()
 
+class UTCDateTime(TypeDecorator):
+    # TIMESTAMP WITH TIME ZONE в Postgres; SQLite хранит время строкой без пояса —
+    # пишем всегда в UTC и возвращаем aware-datetime, чтобы сравнения и сортировка совпадали
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or value.tzinfo is None:
+            return value
+        return value.astimezone(timezone.utc)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+# отправленные разовые напоминания удаляются, повторяющиеся переносятся на следующее срабатывание;
+# окончательно неудачные попытки копируются в failed_reminders
+REMINDER_PENDING = "pending"
+REMINDER_IN_FLIGHT = "in_flight"
+# пользователь заблокировал бота — напоминания не участвуют в выборках до его возвращения
+REMINDER_SUSPENDED = "suspended"
+
+class UserContext(NamedTuple):
+    id: int
+    telegram_id: int
+    tz: tzinfo
+    is_active: bool = True  # False — бот заблокирован, напоминания приостановлены до следующего апдейта пользователя
+
+class ReminderPage(NamedTuple):
+    reminders: List[Dict[str, Any]]
+    start: Optional[tuple]       # (reminder_time, id) первого напоминания страницы
+    has_prev: bool
+    next_start: Optional[tuple]  # (reminder_time, id) первого напоминания следующей страницы
+    from_replica: bool = False   # прочитана с реплики — может отставать на REPLICA_MAX_LAG
+
+def parse_timezone(timezone_offset: str):
+    return pytz.FixedOffset(int(timezone_offset) * 60)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, autoincrement=True)
     telegram_id = Column(BigInteger, nullable=False, unique=True)
     timezone = Column(String, nullable=True)
+    # окно дайджеста в секундах; NULL — значение DIGEST_WINDOW из конфига, 0 — без дайджеста
+    digest_window = Column(Integer, nullable=True)
+    is_active = Column(Boolean, nullable=False, default=True, server_default=text("true"))
     reminders = relationship("Reminder", back_populates="user", cascade="all, delete-orphan")
 
 
@@ -31,85 +240,288 @@ class Reminder(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)  # внешний ключ
     title = Column(String, nullable=False)
-    reminder_time = Column(TIMESTAMP(timezone=True), nullable=False)
+    reminder_time = Column(UTCDateTime(), nullable=False, index=True)
     message = Column(String)
+    # до этого момента строка не считается к отправке: время напоминания, аренда реплики или backoff
+    next_attempt_at = Column(UTCDateTime(), nullable=False)
+    claimed_by = Column(String, nullable=True)
+    status = Column(String, nullable=False, default=REMINDER_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    recurrence = Column(String, nullable=True)  # правило повтора, см. recurrence.py; reminder_time — ближайшее срабатывание
     user = relationship("User", back_populates="reminders")
 
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    __table_args__ = (
+        # список напоминаний пользователя: WHERE user_id = ? ORDER BY reminder_time
+        Index("ix_reminders_user_time", "user_id", "reminder_time"),
+        # частичный индекс: приостановленные напоминания неактивных пользователей в него не попадают
+        Index(
+            "ix_reminders_due",
+            "next_attempt_at",
+            postgresql_where=text(f"status <> '{REMINDER_SUSPENDED}'"),
+            sqlite_where=text(f"status <> '{REMINDER_SUSPENDED}'")
+        ),
+    )
 
-async def create_user_remind(telegram_id: int, title: str, reminder_time, message: str):
-    async with async_session() as session:
-        result = await session.execute(
-            select(User.id).where(User.telegram_id == telegram_id)
-        )
-        user_id = result.scalar()
-        if not user_id:
-            raise ValueError(f"Пользователь с telegram_id {telegram_id} не найден")
-        reminder_time = reminder_time.replace(second=0, microsecond=0)
-        reminder = Reminder(
-            user_id=user_id,
-            title=title,
-            reminder_time=reminder_time,
-            message=message
-        )
-        session.add(reminder)
+
+# dead-letter: напоминания, которые так и не удалось доставить
+class FailedReminder(Base):
+    __tablename__ = "failed_reminders"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    reminder_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    title = Column(String, nullable=False)
+    reminder_time = Column(UTCDateTime(), nullable=False)
+    message = Column(String)
+    attempts = Column(Integer, nullable=False)
+    last_error = Column(String, nullable=True)
+    failed_at = Column(UTCDateTime(), nullable=False)
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(String, nullable=True)  # JSON
+    expires_at = Column(UTCDateTime(), nullable=False, index=True)
+
+# применённые миграции, см. migrations.py
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(UTCDateTime(), nullable=False)
+
+def pool_stats() -> Dict[str, Any]:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkouts": pool.checkouts,
+        "checkout_wait_avg": pool.checkout_wait_total / pool.checkouts if pool.checkouts else 0.0,
+        "checkout_wait_max": pool.checkout_wait_max,
+    }
+
+async def warm_pool(connections: int):
+    # открываем соединения заранее, чтобы первый всплеск после деплоя не платил за handshake
+    conns = await asyncio.gather(*(engine.connect() for _ in range(connections)))
+    try:
+        await asyncio.gather(*(conn.execute(text("SELECT 1")) for conn in conns))
+    finally:
+        await asyncio.gather(*(conn.close() for conn in conns))
+
+@asynccontextmanager
+async def unit_of_work():
+    # одна сессия и одна транзакция на апдейт; соединение берётся из пула только при первом запросе
+    session = async_session()
+    token = current_session.set(session)
+    try:
+        yield session
         await session.commit()
+    except BaseException:
+        await session.rollback()
+        raise
+    else:
+        for callback in session.info.pop("after_commit", []):
+            result = callback()
+            if inspect.isawaitable(result):
+                await result
+    finally:
+        reader = session.info.pop("replica_session", None)
+        if reader is not None:
+            await reader.close()
+        # и после коммита, и после отката: страницы, отрисованные внутри транзакции, могли увидеть её записи
+        for user_id in session.info.pop("touched_users", set()):
+            list_cache.invalidate(user_id)
+        current_session.reset(token)
+        await session.close()
 
-async def update_reminder_by_id(reminder_id: int, title: str, reminder_time, message: str):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Reminder).where(Reminder.id == reminder_id)
-        )
-        reminder = result.scalar_one_or_none()
-        if reminder:
-            reminder.title = title
-            reminder.reminder_time = reminder_time.replace(second=0, microsecond=0)
-            reminder.message = message
-            await session.commit()
+def after_commit(session: AsyncSession, callback: Callable[[], Any]):
+    # расписание и кэши обновляем только когда запись точно видна остальным;
+    # ответы в Telegram после записи — тоже здесь: транзакция (и писатель SQLite) не ждёт Bot API
+    session.info.setdefault("after_commit", []).append(callback)
 
-async def create_or_update_user(telegram_id: int, timezone: str):
-    async with async_session() as session:
+def _touch_list(session: AsyncSession, user_id: int):
+    # сразу — чтобы это же обновление не отрисовало старый список, и ещё раз по завершении транзакции
+    list_cache.invalidate(user_id)
+    session.info.setdefault("touched_users", set()).add(user_id)
+    _wrote(session, user_id)
+
+def _list_changed(user_id: int):
+    # запись доставки идёт мимо unit_of_work: сбрасываем кэш и на sticky-окно читаем список пользователя с primary
+    list_cache.invalidate(user_id)
+    if replica is not None:
+        recent_writers.set(user_id, True)
+
+def _wrote(session: AsyncSession, user_id: Optional[int] = None):
+    session.info["wrote"] = True
+    if user_id is not None and replica is not None:
+        recent_writers.set(user_id, True)
+
+def _reader(session: AsyncSession, user_id: Optional[int] = None) -> AsyncSession:
+    # на реплику идут только чтения апдейта, который ещё ничего не записал,
+    # и только если пользователь не писал последние REPLICA_STICKY_SECONDS
+    if (
+        replica is None or not replica.healthy or session.info.get("wrote")
+        or (user_id is not None and recent_writers.get(user_id))
+    ):
+        return session
+    reader = session.info.get("replica_session")
+    if reader is None:
+        reader = session.info["replica_session"] = replica.session()
+    return reader
+
+async def _read(session: AsyncSession, statement, user_id: Optional[int] = None):
+    reader = _reader(session, user_id)
+    if reader is session:
+        return await session.execute(statement)
+    try:
+        result = await reader.execute(statement)
+    except DBAPIError as e:
+        # реплика недоступна — этот запрос и следующие до проверки здоровья идут на primary
+        replica.mark_unhealthy(str(e))
+        replica.fallbacks += 1
+        session.info.pop("replica_session", None)
+        await reader.close()
+        return await session.execute(statement)
+    replica.reads += 1
+    return result
+
+async def create_user_remind(session: AsyncSession, user_id: int, title: str, reminder_time, message: str, recurrence: str = None):
+    reminder_time = reminder_time.replace(second=0, microsecond=0)
+    reminder = Reminder(
+        user_id=user_id,
+        title=title,
+        reminder_time=reminder_time,
+        message=message,
+        next_attempt_at=reminder_time,
+        recurrence=recurrence
+    )
+    session.add(reminder)
+    await session.flush()
+    _touch_list(session, user_id)
+    return reminder
+
+async def bulk_create_reminders(session: AsyncSession, user_id: int, reminders: List[Dict[str, Any]]):
+    # одна многострочная INSERT ... VALUES на пачку вместо сессии на каждое напоминание
+    rows = []
+    for r in reminders:
+        reminder_time = r["reminder_time"].replace(second=0, microsecond=0)
+        rows.append({
+            "user_id": user_id,
+            "title": r["title"],
+            "reminder_time": reminder_time,
+            "message": r["message"],
+            "next_attempt_at": reminder_time,
+            "recurrence": r["recurrence"],
+            "status": REMINDER_PENDING,
+            "attempts": 0,
+        })
+    result = await session.execute(
+        insert(Reminder).values(rows).returning(Reminder.id, Reminder.reminder_time)
+    )
+    _touch_list(session, user_id)
+    return result.all()
+
+async def update_reminder_by_id(session: AsyncSession, reminder_id: int, user_id: int, title: str, reminder_time, message: str, recurrence: str = None):
+    result = await session.execute(
+        select(Reminder).where(Reminder.id == reminder_id, Reminder.user_id == user_id)
+    )
+    reminder = result.scalar_one_or_none()
+    if reminder:
+        reminder.title = title
+        reminder.reminder_time = reminder_time.replace(second=0, microsecond=0)
+        reminder.message = message
+        reminder.recurrence = recurrence
+        reminder.next_attempt_at = reminder.reminder_time
+        reminder.claimed_by = None
+        reminder.status = REMINDER_PENDING
+        reminder.attempts = 0
+        reminder.last_error = None
+        await session.flush()
+    _touch_list(session, user_id)
+    return reminder
+
+async def create_or_update_user(session: AsyncSession, telegram_id: int, timezone: str):
+    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    user = result.scalars().first()
+    if user:
+        user.timezone = timezone
+        logger.info("User updated", extra={"telegram_id": telegram_id})
+    else:
+        user = User(
+            telegram_id=telegram_id,
+            timezone=timezone
+        )
+        # точка сохранения: гонка двух /register откатывает только эту вставку, а не всё обновление
         try:
-            result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-            user = result.scalars().first()
-            if user:
-                user.timezone = timezone
-                print(f"Пользователь {telegram_id} найден — обновлены данные.")
-            else:
-                user = User(
-                    telegram_id=telegram_id,
-                    timezone=timezone
-                )
+            async with session.begin_nested():
                 session.add(user)
-                print(f"Создан новый пользователь {telegram_id}.")
-            await session.commit()
-            await session.refresh(user)
-            return user
         except IntegrityError as e:
-            await session.rollback()
-            print(f"Ошибка при сохранении пользователя: {e}")
+            logger.error("Failed to save user", extra={"telegram_id": telegram_id, "error": str(e)})
             return None
+        logger.info("User created", extra={"telegram_id": telegram_id})
+    await session.flush()
+    user_ctx = UserContext(user.id, user.telegram_id, parse_timezone(user.timezone), user.is_active)
+    after_commit(session, lambda: user_cache.set(telegram_id, user_ctx))
+    _touch_list(session, user.id)  # время в списке отрисовано в старом часовом поясе
+    return user
 
-async def get_user_reminders(telegram_id: int) -> List[Dict[str, Any]]:
-    async with async_session() as session:
-        result = await session.execute(select(User.id).where(User.telegram_id == telegram_id))
-        user_id = result.scalar()
-        if not user_id:
-            return []
-        stmt = select(Reminder).where(Reminder.user_id == user_id).order_by(Reminder.reminder_time)
-        result = await session.execute(stmt)
-        reminders = result.scalars().all()
-        return [
-            {
-                "id": r.id,
-                "title": r.title,
-                "reminder_time": r.reminder_time,
-                "message": r.message
-            }
-            for r in reminders
-        ]
+async def get_reminder(session: AsyncSession, reminder_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    result = await _read(
+        session,
+        select(Reminder.id, Reminder.title, Reminder.reminder_time, Reminder.message, Reminder.recurrence)
+        .where(Reminder.id == reminder_id, Reminder.user_id == user_id),
+        user_id
+    )
+    row = result.first()
+    return row._asdict() if row else None
+
+async def get_reminders_page(session: AsyncSession, user_id: int, page_size: int, start: tuple = None, before: tuple = None) -> ReminderPage:
+    # keyset-пагинация по (reminder_time, id): стоимость не зависит от номера страницы
+    key = tuple_(Reminder.reminder_time, Reminder.id)
+    columns = (Reminder.id, Reminder.title, Reminder.reminder_time, Reminder.message, Reminder.recurrence)
+    has_next = before is not None
+    from_replica = _reader(session, user_id) is not session
+    if before is None:
+        stmt = select(*columns).where(Reminder.user_id == user_id)
+        if start is not None:
+            stmt = stmt.where(key >= tuple_(*start))
+        result = await _read(
+            session, stmt.order_by(Reminder.reminder_time, Reminder.id).limit(page_size + 1), user_id
+        )
+        rows = result.all()
+        if rows or start is None:
+            has_prev = start is not None and (await _read(
+                session, select(Reminder.id).where(Reminder.user_id == user_id, key < tuple_(*start)).limit(1), user_id
+            )).scalar() is not None
+            next_start = (rows[page_size].reminder_time, rows[page_size].id) if len(rows) > page_size else None
+            return ReminderPage(
+                [row._asdict() for row in rows[:page_size]],
+                (rows[0].reminder_time, rows[0].id) if rows else None,
+                has_prev,
+                next_start,
+                from_replica
+            )
+        # страница опустела (например, после удаления) — показываем предыдущую
+        before = start
+    result = await _read(
+        session,
+        select(*columns)
+        .where(Reminder.user_id == user_id, key < tuple_(*before))
+        .order_by(Reminder.reminder_time.desc(), Reminder.id.desc())
+        .limit(page_size + 1),
+        user_id
+    )
+    rows = result.all()
+    page_rows = list(reversed(rows[:page_size]))
+    return ReminderPage(
+        [row._asdict() for row in page_rows],
+        (page_rows[0].reminder_time, page_rows[0].id) if page_rows else None,
+        len(rows) > page_size,
+        before if has_next else None,
+        from_replica
+    )
 
 async def get_all_reminders():
     async with async_session() as session:
@@ -124,27 +536,237 @@ async def delete_expired_reminders():
         stmt = delete(Reminder).where(Reminder.reminder_time <= datetime.now(timezone.utc))
         result = await session.execute(stmt)
         await session.commit()
-        print(f"[Cleaner] Deleted {result.rowcount} expired reminders")
+        list_cache.clear()
+        logger.info("Deleted expired reminders", extra={"count": result.rowcount})
+
+async def delete_reminder_by_id(session: AsyncSession, reminder_id: int, user_id: int):
+    stmt = delete(Reminder).where(Reminder.id == reminder_id, Reminder.user_id == user_id)
+    await session.execute(stmt)
+    _touch_list(session, user_id)
 
-async def delete_reminder_by_id(reminder_id: int):
+async def claim_due_reminders(owner: str, limit: int, lease: float):
+    now = datetime.now(timezone.utc)
+    claim = (
+        select(
+            Reminder.id, Reminder.user_id, User.telegram_id, Reminder.title, Reminder.message,
+            Reminder.reminder_time, Reminder.next_attempt_at,
+            func.coalesce(User.digest_window, DIGEST_WINDOW).label("digest_window")
+        )
+        .join(User, Reminder.user_id == User.id)
+        .order_by(Reminder.next_attempt_at)
+        .with_for_update(of=Reminder, skip_locked=True)
+    )
     async with async_session() as session:
-        stmt = delete(Reminder).where(Reminder.id == reminder_id)
-        await session.execute(stmt)
+        # SKIP LOCKED: параллельные реплики разбирают разные строки и не ждут друг друга
+        result = await session.execute(claim.where(Reminder.next_attempt_at <= now, Reminder.status != REMINDER_SUSPENDED).limit(limit))
+        reminders = result.all()
+        # дайджест: забираем заодно напоминания тех же пользователей, наступающие в пределах их окна
+        windows = {r.user_id: r.digest_window for r in reminders if r.digest_window}
+        if windows:
+            # только ещё не наступившие pending: строки в отправке (аренда сдвигает next_attempt_at вперёд)
+            # и отложенные после ошибки сюда попасть не должны
+            result = await session.execute(
+                claim.where(
+                    Reminder.user_id.in_(list(windows)),
+                    Reminder.status == REMINDER_PENDING,
+                    Reminder.reminder_time > now,
+                    Reminder.reminder_time <= now + timedelta(seconds=max(windows.values())),
+                    Reminder.id.notin_([r.id for r in reminders])
+                )
+            )
+            reminders += [
+                r for r in result.all()
+                if r.reminder_time <= now + timedelta(seconds=windows[r.user_id])
+            ]
+        if reminders:
+            await session.execute(
+                update(Reminder)
+                .where(Reminder.id.in_([r.id for r in reminders]))
+                .values(
+                    next_attempt_at=now + timedelta(seconds=lease),
+                    claimed_by=owner,
+                    status=REMINDER_IN_FLIGHT,
+                    attempts=Reminder.attempts + 1
+                )
+            )
         await session.commit()
+        return reminders
 
-async def get_all_reminders_all():
+async def extend_claims(owner: str, reminder_ids, lease: float) -> set:
+    # строки ждут в очереди процесса дольше аренды (лимит чата, retry_after): продлеваем, пока они за нами.
+    # возвращает id, которые всё ещё принадлежат owner
+    ids = list(reminder_ids)
+    owned = set()
     async with async_session() as session:
+        for i in range(0, len(ids), 1000):
+            result = await session.execute(
+                update(Reminder)
+                .where(Reminder.id.in_(ids[i:i + 1000]), Reminder.claimed_by == owner, Reminder.status == REMINDER_IN_FLIGHT)
+                .values(next_attempt_at=datetime.now(timezone.utc) + timedelta(seconds=lease))
+                .returning(Reminder.id)
+            )
+            owned.update(result.scalars())
+        await session.commit()
+    return owned
+
+def _advance(reminder: Reminder, timezone_offset: str, now: datetime) -> Optional[datetime]:
+    # переносим повторяющееся напоминание на следующее срабатывание вместо удаления строки
+    next_time = next_occurrence(reminder.recurrence, reminder.reminder_time, parse_timezone(timezone_offset), now)
+    if next_time is None:
+        return None
+    reminder.reminder_time = next_time.astimezone(timezone.utc)
+    reminder.next_attempt_at = reminder.reminder_time
+    reminder.claimed_by = None
+    reminder.status = REMINDER_PENDING
+    reminder.attempts = 0
+    reminder.last_error = None
+    return reminder.reminder_time
+
+async def finalize_reminders(reminder_ids: List[int], owner: str) -> Dict[int, datetime]:
+    # если напоминание успели отредактировать, claimed_by сброшен и строка остаётся;
+    # возвращает время следующего срабатывания для перенесённых повторяющихся
+    owned = (Reminder.id.in_(reminder_ids), Reminder.claimed_by == owner)
+    rescheduled = {}
+    async with async_session() as session:
+        # разовые удаляются одним DELETE на весь дайджест
+        result = await session.execute(
+            delete(Reminder).where(*owned, Reminder.recurrence.is_(None)).returning(Reminder.user_id)
+        )
+        user_ids = set(result.scalars())
         result = await session.execute(
-            select(Reminder).options(selectinload(Reminder.user))
+            select(Reminder, User.timezone)
+            .join(User, Reminder.user_id == User.id)
+            .where(*owned, Reminder.recurrence.is_not(None))
         )
-        return result.scalars().all()
+        now = datetime.now(timezone.utc)
+        for reminder, timezone_offset in result.all():
+            user_ids.add(reminder.user_id)
+            next_time = _advance(reminder, timezone_offset, now)
+            if next_time is None:
+                await session.delete(reminder)
+            else:
+                rescheduled[reminder.id] = next_time
+        await session.commit()
+    for user_id in user_ids:
+        _list_changed(user_id)
+    return rescheduled
 
-async def is_registered(telegram_id: int) -> bool:
+async def deactivate_user(telegram_id: int) -> List[int]:
+    # чат недоступен навсегда (бот заблокирован, аккаунт удалён): приостанавливаем все напоминания.
+    # и для уже неактивного пользователя: строки, созданные или отредактированные через другую реплику
+    # до его возвращения, иначе захватывались бы по кругу с каждой арендой
     async with async_session() as session:
+        user_id = await session.scalar(
+            update(User).where(User.telegram_id == telegram_id).values(is_active=False).returning(User.id)
+        )
+        if user_id is None:
+            await session.commit()
+            return []
         result = await session.execute(
-            select(User).where(User.telegram_id == telegram_id)
+            update(Reminder).where(Reminder.user_id == user_id, Reminder.status != REMINDER_SUSPENDED)
+            .values(status=REMINDER_SUSPENDED, claimed_by=None, attempts=0)
+            .returning(Reminder.id)
         )
-        user = result.scalar_one_or_none()
-        return user is not None
+        suspended = list(result.scalars())
+        await session.commit()
+    user_cache.invalidate(telegram_id)
+    logger.info("User deactivated", extra={"telegram_id": telegram_id, "suspended": len(suspended)})
+    return suspended
 
+async def reactivate_user(session: AsyncSession, telegram_id: int) -> List[tuple]:
+    # пропущенные за время блокировки напоминания уходят сразу, повторяющиеся затем переносятся дальше
+    user_id = await session.scalar(
+        update(User).where(User.telegram_id == telegram_id, User.is_active.is_(False))
+        .values(is_active=True).returning(User.id)
+    )
+    if user_id is None:
+        return []
+    _wrote(session, user_id)
+    after_commit(session, lambda: user_cache.invalidate(telegram_id))
+    result = await session.execute(
+        update(Reminder).where(Reminder.user_id == user_id, Reminder.status == REMINDER_SUSPENDED)
+        .values(status=REMINDER_PENDING, next_attempt_at=Reminder.reminder_time, last_error=None)
+        .returning(Reminder.id, Reminder.next_attempt_at)
+    )
+    resumed = result.all()
+    logger.info("User reactivated", extra={"telegram_id": telegram_id, "resumed": len(resumed)})
+    return resumed
+
+async def set_digest_window(session: AsyncSession, telegram_id: int, seconds: Optional[int]):
+    await session.execute(update(User).where(User.telegram_id == telegram_id).values(digest_window=seconds))
+    _wrote(session)
+
+async def record_delivery_failure(
+    reminder_id: int,
+    owner: str,
+    error: str,
+    max_attempts: int,
+    backoff_base: float,
+    backoff_max: float
+) -> Optional[datetime]:
+    # возвращает новое время попытки, если строка осталась в reminders
+    async with async_session() as session:
+        result = await session.execute(
+            select(Reminder, User.timezone)
+            .join(User, Reminder.user_id == User.id)
+            .where(Reminder.id == reminder_id, Reminder.claimed_by == owner)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        reminder, timezone_offset = row
+        now = datetime.now(timezone.utc)
+        next_time = moved_user = None
+        if reminder.attempts >= max_attempts:
+            session.add(FailedReminder(
+                reminder_id=reminder.id,
+                user_id=reminder.user_id,
+                title=reminder.title,
+                reminder_time=reminder.reminder_time,
+                message=reminder.message,
+                attempts=reminder.attempts,
+                last_error=error,
+                failed_at=now
+            ))
+            logger.warning("Reminder moved to dead letter", extra={"reminder_id": reminder_id, "attempts": reminder.attempts, "error": error})
+            # пропущенное срабатывание остаётся в dead letter, само правило продолжает работать
+            next_time = _advance(reminder, timezone_offset, now) if reminder.recurrence else None
+            if next_time is None:
+                await session.delete(reminder)
+            moved_user = reminder.user_id
+        else:
+            delay = min(backoff_max, backoff_base * 2 ** (reminder.attempts - 1))
+            reminder.status = REMINDER_PENDING
+            reminder.claimed_by = None
+            reminder.last_error = error
+            reminder.next_attempt_at = now + timedelta(seconds=delay)
+            next_time = reminder.next_attempt_at
+        await session.commit()
+        if moved_user is not None:
+            _list_changed(moved_user)
+        return next_time
+
+async def get_upcoming_reminders(until: datetime):
+    async with async_session() as session:
+        result = await session.execute(
+            select(Reminder.id, Reminder.next_attempt_at)
+            .where(Reminder.next_attempt_at <= until, Reminder.status != REMINDER_SUSPENDED)
+        )
+        return result.all()
 
+async def get_user_context(session: AsyncSession, telegram_id: int) -> Optional[UserContext]:
+    cached = user_cache.get(telegram_id)
+    if cached is not None:
+        return cached or None
+    stmt = select(User.id, User.timezone, User.is_active).where(User.telegram_id == telegram_id)
+    row = (await _read(session, stmt)).first()
+    if row is None and _reader(session) is not session:
+        # только что зарегистрированный пользователь мог ещё не доехать до реплики
+        row = (await session.execute(stmt)).first()
+    if row is None:
+        # отрицательный ответ живёт недолго: пользователь вот-вот может зарегистрироваться
+        user_cache.set(telegram_id, False, ttl=REGISTRATION_CACHE_NEGATIVE_TTL)
+        return None
+    user_ctx = UserContext(row.id, telegram_id, parse_timezone(row.timezone), row.is_active)
+    user_cache.set(telegram_id, user_ctx)
+    return user_ctx
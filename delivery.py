@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter,
+    TelegramNetworkError, TelegramServerError
+)
+
+from ratelimit import TokenBucket, KeyedTokenBuckets
+import metrics
+
+logger = logging.getLogger("delivery")
+
+
+MESSAGE_LIMIT = 4096
+# ответы Bot API, после которых в этот чат писать бессмысленно
+UNAVAILABLE_CHAT_ERRORS = ("chat not found", "user is deactivated", "bot was blocked", "bot was kicked", "peer_id_invalid")
+
+
+def is_chat_unavailable(error: TelegramAPIError) -> bool:
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and any(
+        marker in error.message.lower() for marker in UNAVAILABLE_CHAT_ERRORS
+    )
+
+
+def format_reminder(reminder) -> str:
+    return f"🔔 Reminder: {reminder.title}\n{reminder.message or ''}"
+
+
+def format_digest(reminders: List) -> List[str]:
+    # одно напоминание — как раньше; несколько — одним сообщением, порезанным по лимиту Telegram
+    if len(reminders) == 1:
+        blocks = [format_reminder(reminders[0])]
+    else:
+        blocks = [f"🔔 {len(reminders)} reminders:"] + [
+            f"📌 {r.title}\n{r.message or ''}".rstrip() for r in reminders
+        ]
+    parts, current = [], ""
+    for block in blocks:
+        while len(block) > MESSAGE_LIMIT:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(block[:MESSAGE_LIMIT])
+            block = block[MESSAGE_LIMIT:]
+        candidate = f"{current}\n\n{block}" if current else block
+        if len(candidate) > MESSAGE_LIMIT:
+            parts.append(current)
+            candidate = block
+        current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+class DeliveryPipeline:
+    def __init__(
+        self,
+        bot: Bot,
+        on_sent: Callable[[List[int]], Awaitable[None]],
+        on_failed: Callable[[List[int], str], Awaitable[None]],
+        on_unavailable: Callable[[int, List[int], str], Awaitable[None]],
+        workers: int,
+        queue_size: int,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: int,
+        max_retries: int
+    ):
+        self.bot = bot
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.on_unavailable = on_unavailable
+        self.workers = workers
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue()
+        # лимит на все принятые пачки — в очереди, отложенные за занятым чатом и в отправке:
+        # иначе горячий чат копит неограниченный хвост, а submit не тормозит захват новых строк
+        self._slots = asyncio.Semaphore(queue_size)
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets = KeyedTokenBuckets(chat_rate, chat_burst, max_keys=10_000)
+        self._resume_at = 0.0  # flood wait от Telegram действует на всего бота
+        self._chats = {}  # chat_id -> отложенные сообщения чата, пока его обслуживает воркер
+        # id принятых и ещё не завершённых напоминаний: их аренду продлевает main.lease_renewer,
+        # а повторный захват тех же строк не ставит их в очередь второй раз
+        self.claimed = set()
+        self.sent = 0
+        self.failed = 0
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, reminders: List):
+        # reminders — одно напоминание или дайджест, все для одного чата
+        await self._slots.acquire()
+        self.claimed.update(r.id for r in reminders)
+        self.queue.put_nowait(reminders)
+
+    def release(self, reminder_ids):
+        # аренда истекла и строки достались другой реплике — сами их уже не отправляем
+        self.claimed.difference_update(reminder_ids)
+
+    def qsize(self) -> int:
+        return self.queue.qsize() + sum(len(pending) for pending in self._chats.values())
+
+    async def _worker(self):
+        # чат обслуживает не больше одного воркера: ожидание лимита чата не занимает остальных
+        while True:
+            reminders = await self.queue.get()
+            chat_id = int(reminders[0].telegram_id)
+            pending = self._chats.get(chat_id)
+            if pending is not None:
+                pending.append(reminders)
+                continue
+            pending = self._chats[chat_id] = deque([reminders])
+            try:
+                while pending:
+                    reminders = pending.popleft()
+                    try:
+                        await self._deliver(reminders)
+                    except Exception:
+                        logger.exception("Error delivering reminders", extra={"reminder_ids": [r.id for r in reminders]})
+                    finally:
+                        self.release(r.id for r in reminders)
+                        self.queue.task_done()
+                        self._slots.release()
+            finally:
+                del self._chats[chat_id]
+
+    async def _deliver(self, reminders: List):
+        reminders = [r for r in reminders if r.id in self.claimed]
+        if not reminders:
+            return
+        chat_id = int(reminders[0].telegram_id)
+        reminder_ids = [r.id for r in reminders]
+        parts = format_digest(reminders)
+        sent_parts = 0  # при повторе не дублируем уже отправленные части дайджеста
+        error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                while sent_parts < len(parts):
+                    await self.chat_buckets.get(chat_id).acquire()
+                    await self.global_bucket.acquire()
+                    pause = self._resume_at - time.monotonic()
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                    await self.bot.send_message(chat_id, parts[sent_parts])
+                    sent_parts += 1
+            except TelegramRetryAfter as e:
+                logger.warning("Flood limit hit", extra={"reminder_ids": reminder_ids, "retry_after": e.retry_after})
+                self._resume_at = max(self._resume_at, time.monotonic() + e.retry_after)
+                error = e
+                continue
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.info("Transient error", extra={"reminder_ids": reminder_ids, "error": str(e), "sampled": True})
+                await asyncio.sleep(2 ** attempt)
+                error = e
+                continue
+            except TelegramAPIError as e:
+                if is_chat_unavailable(e):
+                    # не ретраим и не копим попытки: пользователь выключается целиком
+                    logger.info("Chat unavailable", extra={"telegram_id": chat_id, "error": str(e)})
+                    self.failed += len(reminder_ids)
+                    metrics.deliveries.inc("chat_unavailable", amount=len(reminder_ids))
+                    await self.on_unavailable(chat_id, reminder_ids, str(e))
+                    return
+                logger.info("Send failed", extra={"reminder_ids": reminder_ids, "error": str(e), "sampled": True})
+                await self._failed(reminder_ids, str(e))
+                return
+            now = datetime.now(timezone.utc)
+            for reminder in reminders:
+                metrics.delivery_lag.observe((now - reminder.reminder_time).total_seconds())
+            self.sent += len(reminders)
+            metrics.deliveries.inc("sent", amount=len(reminders))
+            await self.on_sent(reminder_ids)
+            logger.info("Reminders sent", extra={"reminder_ids": reminder_ids, "messages": len(parts), "sampled": True})
+            return
+        logger.info("Retries exhausted", extra={"reminder_ids": reminder_ids, "error": str(error), "sampled": True})
+        await self._failed(reminder_ids, str(error))
+
+    async def _failed(self, reminder_ids: List[int], error: str):
+        self.failed += len(reminder_ids)
+        metrics.deliveries.inc("failed", amount=len(reminder_ids))
+        await self.on_failed(reminder_ids, error)
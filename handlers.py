@@ -1,48 +1,123 @@
 from aiogram import Router, F, BaseMiddleware, Bot
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, Update
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import Callable, Dict, Any
+import logging
 import re
+import time
 
-from database import create_user_remind, get_user_reminders, delete_reminder_by_id, create_or_update_user, is_registered, async_session, User, update_reminder_by_id
+from database import list_cache, unit_of_work, after_commit, create_user_remind, get_reminders_page, get_reminder, delete_reminder_by_id, create_or_update_user, get_user_context, update_reminder_by_id, set_digest_window, reactivate_user, UserContext
 import keyboards as kb
-from sqlalchemy import select
+from config import LIST_PAGE_SIZE, LIST_CACHE_PAGES, REPLICA_MAX_LAG, IMPORT_CHUNK_SIZE, IMPORT_MAX_ROWS, IMPORT_MAX_BYTES
+from scheduler import scheduler
+from recurrence import parse_rule, describe
+from importer import import_reminders
+from ratelimit import KeyedTokenBuckets, TokenBucket
+import metrics
 import pytz
 
+logger = logging.getLogger("handlers")
+
 class user_remind(StatesGroup):
     name_remind = State()
     time_remind = State()
     message_remind = State()
-    delete_index = State()
-    show_index = State()
-    edit_index = State()
     edit_name = State()
     edit_time = State()
     edit_message = State()
+    repeat_remind = State()
+    edit_repeat = State()
+    import_file = State()
 
 router = Router()
 
-async def get_reminders_list_text(telegram_id: int) -> str:
-    reminders = await get_user_reminders(telegram_id)
-    if not reminders:
-        return "📋 Your reminders:\n\n🗒 You don't have any reminders yet."
-    async with async_session() as session:
-        result = await session.execute(
-            select(User.timezone).where(User.telegram_id == telegram_id)
-        )
-        timezone_offset_str = result.scalar()
-    timezone_offset = int(timezone_offset_str)
-    tz = pytz.FixedOffset(timezone_offset * 60)
-    response = "📋 Your reminders:\n\n"
-    for i, r in enumerate(reminders, start=1):
-        local_dt = r['reminder_time'].astimezone(tz)
-        local_time_str = local_dt.strftime("%Y-%m-%d %H:%M")
-        response += f"{i}. 📌 {r['title']} — {local_time_str}\n"
-    return response
+async def get_reminders_list(session: AsyncSession, user_ctx: UserContext, start: tuple = None, before: tuple = None):
+    # повторная навигация по тем же страницам обходится без запросов к базе
+    pages = list_cache.get(user_ctx.id)
+    if pages is None:
+        pages = {}
+        list_cache.set(user_ctx.id, pages)
+    cached = pages.get((start, before))
+    if cached and (cached[1] is None or cached[1] > time.monotonic()):
+        return cached[0]
+    page = await get_reminders_page(session, user_ctx.id, LIST_PAGE_SIZE, start=start, before=before)
+    if not page.reminders:
+        rendered = "📋 Your reminders:\n\n🗒 You don't have any reminders yet.", page
+    else:
+        lines = ["📋 Your reminders:\n"]
+        for i, r in enumerate(page.reminders, start=1):
+            local_time_str = r['reminder_time'].astimezone(user_ctx.tz).strftime("%Y-%m-%d %H:%M")
+            repeat_mark = " 🔁" if r['recurrence'] else ""
+            lines.append(f"{i}. 📌 {r['title']} — {local_time_str}{repeat_mark}")
+        rendered = "\n".join(lines) + "\n", page
+    if len(pages) >= LIST_CACHE_PAGES:
+        pages.clear()
+    # если запись инвалидировала кеш во время запроса, pages уже отвязан и результат никто не увидит.
+    # страница с реплики живёт не дольше допустимого отставания: запись доставки могла до неё ещё не доехать
+    pages[(start, before)] = rendered, time.monotonic() + REPLICA_MAX_LAG if page.from_replica else None
+    return rendered
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable,
+        event: Message | CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            name = data["handler"].callback.__name__
+            metrics.handler_latency.observe(elapsed, name)
+            logger.debug("Update handled", extra={"handler": name, "seconds": round(elapsed, 4), "sampled": True})
+
+class FloodControlMiddleware(BaseMiddleware):
+    # внешний middleware на update, до DbSessionMiddleware: лишний апдейт отбрасывается до сессии БД,
+    # состояния FSM, фильтров и перерисовки списка. Сначала bucket пользователя — флудер не расходует общий лимит остальных
+    def __init__(self, user_rate: float, user_burst: int, global_rate: float, global_burst: int, max_users: int):
+        self.users = KeyedTokenBuckets(user_rate, user_burst, max_users) if user_rate > 0 else None
+        self.total = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+
+    async def __call__(
+        self,
+        handler: Callable,
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")  # выставляет UserContextMiddleware из aiogram
+        if self.users is not None and user and not self.users.get(user.id).try_acquire():
+            scope = "user"
+        elif self.total is not None and not self.total.try_acquire():
+            scope = "global"
+        else:
+            return await handler(event, data)
+        metrics.flood_rejected.inc(scope)
+        logger.info("Update dropped by flood control", extra={
+            "telegram_id": user.id if user else None, "scope": scope, "sampled": True
+        })
+        if event.callback_query:
+            # без ответа у клиента крутится индикатор на кнопке
+            await event.callback_query.answer("⏳ Too many requests, try again in a moment.")
+
+class DbSessionMiddleware(BaseMiddleware):
+    # одна сессия на апдейт: чтение состояния FSM, обработчик и функции database.py работают в одной транзакции,
+    # коммит или откат — один раз по завершении обработки. Регистрируется на update до FSMContextMiddleware
+    async def __call__(
+        self,
+        handler: Callable,
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        async with unit_of_work() as session:
+            data["session"] = session
+            return await handler(event, data)
 
 class RegistrationMiddleware(BaseMiddleware):
     async def __call__(
@@ -54,22 +129,37 @@ class RegistrationMiddleware(BaseMiddleware):
         if isinstance(event, Message):
             if event.text and event.text.startswith(('/register', '/start', '/help')):
                 return await handler(event, data)
-            telegram_id = event.from_user.id
-            if not await is_registered(telegram_id):
+            user_ctx = await get_user_context(data["session"], event.from_user.id)
+            if not user_ctx:
+                logger.info("Unregistered user rejected", extra={"telegram_id": event.from_user.id, "sampled": True})
                 await event.answer("❌ You are not registered. Use /register.")
                 return
         elif isinstance(event, CallbackQuery):
             if event.data and re.fullmatch(r"[+-]?\d{1,2}", event.data):
                 return await handler(event, data)
-            telegram_id = event.from_user.id
-            if not await is_registered(telegram_id):
+            user_ctx = await get_user_context(data["session"], event.from_user.id)
+            if not user_ctx:
+                logger.info("Unregistered user rejected", extra={"telegram_id": event.from_user.id, "sampled": True})
                 await event.answer("❌ You are not registered. Use /register.", show_alert=True)
                 return
+        else:
+            return await handler(event, data)
+        if not user_ctx.is_active:
+            # любой апдейт значит, что бот разблокирован: иначе новые напоминания пишутся в обход приостановки
+            await resume_user(data["session"], user_ctx.telegram_id)
+            user_ctx = user_ctx._replace(is_active=True)
+        data["user_ctx"] = user_ctx
         return await handler(event, data)
 
+async def resume_user(session: AsyncSession, telegram_id: int):
+    # пользователь вернулся после блокировки бота — возвращаем его напоминания в расписание
+    for reminder_id, next_attempt_at in await reactivate_user(session, telegram_id):
+        after_commit(session, lambda r=reminder_id, t=next_attempt_at: scheduler.schedule(r, t))
+
 @router.message(CommandStart())
-async def command_start(message: Message):
-    await message.answer('👋 Welcome to the Reminder Bot! Press /help to find out what this bot can do!')
+async def command_start(message: Message, session: AsyncSession):
+    await resume_user(session, message.from_user.id)
+    after_commit(session, lambda: message.answer('👋 Welcome to the Reminder Bot! Press /help to find out what this bot can do!'))
 
 @router.message(Command("help"))
 async def command_help(message: Message):
@@ -78,128 +168,90 @@ async def command_help(message: Message):
         "🚀 <b>/start</b> — Start interacting with the bot\n"
         "📝 <b>/register</b> — Register yourself to use the bot\n"
         "📋 <b>/list</b> — Shows the current reminders\n"
+        "📥 <b>/import</b> — Import reminders from a CSV or .ics file\n"
+        "📦 <b>/digest N</b> — Group reminders due within N minutes into one message (0 — off)\n"
         "❓ <b>/help</b> — Show this help menu",
         parse_mode="HTML"
     )
 
 @router.message(Command('list'))
-async def command_list(message: Message, state: FSMContext):
-    telegram_id = message.from_user.id
-    response = await get_reminders_list_text(telegram_id)
-    sent_message = await message.answer(response, reply_markup=kb.remind_keyboard)
-    await state.update_data(list_message_id=sent_message.message_id)
+async def command_list(message: Message, user_ctx: UserContext, session: AsyncSession):
+    response, page = await get_reminders_list(session, user_ctx)
+    await message.answer(response, reply_markup=kb.reminders_list_keyboard(page))
 
 @router.callback_query(F.data == "back_to_list")
-async def back_to_list_handler(callback: CallbackQuery, state: FSMContext):
+async def back_to_list_handler(callback: CallbackQuery, state: FSMContext, user_ctx: UserContext, session: AsyncSession):
     await callback.answer()
-    telegram_id = callback.from_user.id
-    response = await get_reminders_list_text(telegram_id)
-    await callback.message.edit_text(response, reply_markup=kb.remind_keyboard)
+    response, page = await get_reminders_list(session, user_ctx)
+    await callback.message.edit_text(response, reply_markup=kb.reminders_list_keyboard(page))
     await state.clear()
 
-@router.callback_query(F.data == "show")
-async def command_show(callback: CallbackQuery, state: FSMContext):
+async def get_page(session: AsyncSession, user_ctx: UserContext, direction: str, cursor: str):
+    # "at" — страница, начинающаяся с курсора; "before"/"prev" — предыдущая перед ним
+    cursor = kb.decode_cursor(cursor)
+    if direction in ("before", "prev"):
+        return await get_reminders_list(session, user_ctx, before=cursor)
+    return await get_reminders_list(session, user_ctx, start=cursor)
+
+@router.callback_query(F.data.startswith("list:"))
+async def list_page_handler(callback: CallbackQuery, user_ctx: UserContext, session: AsyncSession):
     await callback.answer()
-    telegram_id = callback.from_user.id
-    reminders = await get_user_reminders(telegram_id)
-    if not reminders:
-        await callback.message.edit_text("🗒 You don't have any reminders yet.", reply_markup=kb.back_keyboard)
-        return
-    await state.update_data(
-        full_reminders=reminders,
-        list_message_id=callback.message.message_id
-    )
-    list_text = await get_reminders_list_text(telegram_id)
-    prompt_text = "\n\nEnter the number of the reminder you want to view:"
-    await callback.message.edit_text(list_text + prompt_text, reply_markup=kb.back_keyboard)
-    await state.set_state(user_remind.show_index)
+    _, direction, cursor = callback.data.split(":", 2)
+    response, page = await get_page(session, user_ctx, direction, cursor)
+    await callback.message.edit_text(response, reply_markup=kb.reminders_list_keyboard(page))
 
-@router.message(user_remind.show_index)
-async def handler_show(message: Message, state: FSMContext, bot: Bot):
-    await message.delete()
-    data = await state.get_data()
-    reminders = data.get("full_reminders", [])
-    list_message_id = data.get("list_message_id")
-    telegram_id = message.from_user.id
-    try:
-        index = int(message.text.strip()) - 1
-        if index < 0 or index >= len(reminders):
-            raise ValueError
-        reminder = reminders[index]
-        async with async_session() as session:
-            result = await session.execute(
-                select(User.timezone).where(User.telegram_id == telegram_id)
-            )
-            timezone_offset_str = result.scalar()
-        timezone_offset = int(timezone_offset_str)
-        utc_dt = reminder['reminder_time']
-        tz = pytz.FixedOffset(timezone_offset * 60)
-        local_dt = utc_dt.astimezone(tz)
-        local_time_str = local_dt.strftime("%Y-%m-%d %H:%M")
-        response = (
-            f"📌 <b>{reminder['title']}</b>\n"
-            f"⏰ <b>Time:</b> {local_time_str}\n"
-            f"💬 <b>Message:</b> {reminder['message']}"
-        )
-        await bot.edit_message_text(chat_id=message.chat.id, message_id=list_message_id, text=response, parse_mode="HTML", reply_markup=kb.back_keyboard)
-    except (ValueError, IndexError):
-        list_text = await get_reminders_list_text(telegram_id)
-        error_text = "❌ Invalid number. Try again."
-        await bot.edit_message_text(chat_id=message.chat.id, message_id=list_message_id, text=list_text + "\n\n" + error_text, reply_markup=kb.back_keyboard)
-        return
-    await state.clear()
+PICK_PROMPTS = {
+    "show": "Choose the reminder you want to view:",
+    "delete": "Choose the reminder you want to delete:",
+    "edit": "Choose the reminder you want to edit:",
+}
 
-@router.callback_query(F.data == "delete")
-async def command_delete(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(F.data.startswith("pick:"))
+async def pick_handler(callback: CallbackQuery, user_ctx: UserContext, session: AsyncSession):
     await callback.answer()
-    telegram_id = callback.from_user.id
-    reminders = await get_user_reminders(telegram_id)
-    if not reminders:
+    _, action, direction, cursor = callback.data.split(":", 3)
+    list_text, page = await get_page(session, user_ctx, direction, cursor)
+    if not page.reminders:
         await callback.message.edit_text("🗒 You don't have any reminders yet.", reply_markup=kb.back_keyboard)
         return
-    await state.update_data(
-        reminder_ids=[r['id'] for r in reminders],
-        list_message_id=callback.message.message_id
+    await callback.message.edit_text(
+        f"{list_text}\n{PICK_PROMPTS[action]}",
+        reply_markup=kb.reminders_pick_keyboard(page, action)
     )
-    list_text = await get_reminders_list_text(telegram_id)
-    prompt_text = "\n\nEnter the number of the reminder you want to delete:"
-    await callback.message.edit_text(list_text + prompt_text, reply_markup=kb.back_keyboard)
-    await state.set_state(user_remind.delete_index)
 
-@router.message(user_remind.delete_index)
-async def handler_delete(message: Message, state: FSMContext, bot: Bot):
-    await message.delete()
-    data = await state.get_data()
-    reminder_ids = data.get("reminder_ids")
-    list_message_id = data.get("list_message_id")
-    telegram_id = message.from_user.id
-    try:
-        index = int(message.text.strip()) - 1
-        if index < 0 or index >= len(reminder_ids):
-            raise ValueError
-        reminder_id = reminder_ids[index]
-        await delete_reminder_by_id(reminder_id)
-        new_list_text = await get_reminders_list_text(telegram_id)
-        success_text = "✅ The reminder has been successfully removed."
-        final_text = new_list_text + "\n\n" + success_text
-        if list_message_id:
-            try:
-                await bot.edit_message_text(
-                    chat_id=message.chat.id,
-                    message_id=list_message_id,
-                    text=final_text,
-                    reply_markup=kb.remind_keyboard
-                )
-            except Exception:
-                await message.answer(final_text, reply_markup=kb.remind_keyboard)
-        else:
-            await message.answer(final_text, reply_markup=kb.remind_keyboard)
-    except (ValueError, IndexError):
-        list_text = await get_reminders_list_text(telegram_id)
-        error_text = "❌ Invalid number. Try again."
-        await bot.edit_message_text(chat_id=message.chat.id, message_id=list_message_id, text=list_text + "\n\n" + error_text, reply_markup=kb.back_keyboard)
+def parse_pick(data: str):
+    _, reminder_id, cursor = data.split(":", 2)
+    return int(reminder_id), cursor
+
+@router.callback_query(F.data.startswith("show:"))
+async def handler_show(callback: CallbackQuery, user_ctx: UserContext, session: AsyncSession):
+    reminder_id, cursor = parse_pick(callback.data)
+    reminder = await get_reminder(session, reminder_id, user_ctx.id)
+    if not reminder:
+        await callback.answer("❌ This reminder no longer exists.", show_alert=True)
         return
-    await state.clear()
+    await callback.answer()
+    local_dt = reminder['reminder_time'].astimezone(user_ctx.tz)
+    local_time_str = local_dt.strftime("%Y-%m-%d %H:%M")
+    response = (
+        f"📌 <b>{reminder['title']}</b>\n"
+        f"⏰ <b>Time:</b> {local_time_str}\n"
+        f"🔁 <b>Repeat:</b> {describe(reminder['recurrence'])}\n"
+        f"💬 <b>Message:</b> {reminder['message']}"
+    )
+    await callback.message.edit_text(response, parse_mode="HTML", reply_markup=kb.back_to_page_keyboard(cursor))
+
+@router.callback_query(F.data.startswith("del:"))
+async def handler_delete(callback: CallbackQuery, user_ctx: UserContext, session: AsyncSession):
+    await callback.answer()
+    reminder_id, cursor = parse_pick(callback.data)
+    await delete_reminder_by_id(session, reminder_id, user_ctx.id)
+    after_commit(session, lambda: scheduler.cancel(reminder_id))
+    new_list_text, page = await get_page(session, user_ctx, "at", cursor)
+    success_text = "✅ The reminder has been successfully removed."
+    after_commit(session, lambda: callback.message.edit_text(
+        new_list_text + "\n\n" + success_text, reply_markup=kb.reminders_list_keyboard(page)
+    ))
 
 @router.callback_query(F.data == "create")
 async def command_create(callback: CallbackQuery, state: FSMContext):
@@ -208,7 +260,8 @@ async def command_create(callback: CallbackQuery, state: FSMContext):
         '<b>📌 Create a new reminder</b>\n\n'
         '<b>❌ | 📝 Reminder name: </b>\n'
         '<b>❌ | ⏰ Time to receive reminder: </b>\n'
-        '<b>❌ | 💬 Reminder message: </b>\n\n'
+        '<b>❌ | 💬 Reminder message: </b>\n'
+        '<b>❌ | 🔁 Repeat: </b>\n\n'
         '<b># Please select the name of the reminder, no more than 20 characters #</b>',
         parse_mode=ParseMode.HTML,
         reply_markup=kb.back_keyboard
@@ -228,7 +281,8 @@ async def handler_create_name(message: Message, state: FSMContext, bot: Bot):
             '<b>📌 Create a new reminder</b>\n\n'
             '<b>❌ | 📝 Reminder name: </b>\n'
             '<b>❌ | ⏰ Time to receive reminder: </b>\n'
-            '<b>❌ | 💬 Reminder message: </b>\n\n'
+            '<b>❌ | 💬 Reminder message: </b>\n'
+            '<b>❌ | 🔁 Repeat: </b>\n\n'
             '<b># Please select the name of the reminder, no more than 20 characters #</b>'
         )
         await bot.edit_message_text(
@@ -243,7 +297,8 @@ async def handler_create_name(message: Message, state: FSMContext, bot: Bot):
         '<b>✅ | 📝 Reminder name:</b> '
         f'<b>{name_remind}</b>\n'
         '<b>❌ | ⏰ Time to receive reminder: </b>\n'
-        '<b>❌ | 💬 Reminder message: </b>\n\n'
+        '<b>❌ | 💬 Reminder message: </b>\n'
+        '<b>❌ | 🔁 Repeat: </b>\n\n'
         '<b># Please select the time of the reminder. Example: YYYY-MM-DD HH:MM #</b>'
     )
     await bot.edit_message_text(
@@ -256,18 +311,18 @@ async def handler_create_name(message: Message, state: FSMContext, bot: Bot):
     await state.set_state(user_remind.time_remind)
 
 @router.message(user_remind.time_remind)
-async def handler_create_date(message: Message, state: FSMContext, bot: Bot):
+async def handler_create_date(message: Message, state: FSMContext, bot: Bot, user_ctx: UserContext):
     await message.delete()
     data = await state.get_data()
     reminder_message_id = data.get("reminder_message_id")
     name_remind = data.get('name_remind')
-    telegram_id = message.from_user.id
     time_remind_str = message.text.strip()
     base_text = (
         '<b>📌 Create a new reminder</b>\n\n'
         f'<b>✅ | 📝 Reminder name:</b> <b>{name_remind}</b>\n'
         '<b>❌ | ⏰ Time to receive reminder: </b>\n'
-        '<b>❌ | 💬 Reminder message: </b>\n\n'
+        '<b>❌ | 💬 Reminder message: </b>\n'
+        '<b>❌ | 🔁 Repeat: </b>\n\n'
         '<b># Please select the time of the reminder. Example: YYYY-MM-DD HH:MM #</b>'
     )
     try:
@@ -279,13 +334,7 @@ async def handler_create_date(message: Message, state: FSMContext, bot: Bot):
             text=f"{error_text}\n\n{base_text}", parse_mode="HTML", reply_markup=kb.back_keyboard
         )
         return
-    async with async_session() as session:
-        result = await session.execute(
-            select(User.timezone).where(User.telegram_id == telegram_id)
-        )
-        timezone_offset_str = result.scalar()
-    timezone_offset = int(timezone_offset_str)
-    tz = pytz.FixedOffset(timezone_offset * 60)
+    tz = user_ctx.tz
     dt_local = tz.localize(dt_naive)
     now_local = datetime.now(tz)
     if dt_local < now_local:
@@ -296,12 +345,13 @@ async def handler_create_date(message: Message, state: FSMContext, bot: Bot):
         )
         return
     dt_utc = dt_local.astimezone(pytz.UTC)
-    await state.update_data(time_remind=dt_utc, time_remind_str=time_remind_str)
+    await state.update_data(time_remind=dt_utc.isoformat(), time_remind_str=time_remind_str)
     new_text = (
         '<b>📌 Create a new reminder</b>\n\n'
         f'<b>✅ | 📝 Reminder name:</b> <b>{name_remind}</b>\n'
         f'<b>✅ | ⏰ Time to receive reminder: </b> <b>{time_remind_str}</b>\n'
-        '<b>❌ | 💬 Reminder message: </b>\n\n'
+        '<b>❌ | 💬 Reminder message: </b>\n'
+        '<b>❌ | 🔁 Repeat: </b>\n\n'
         '<b># Please Enter the message of the reminder. #</b>'
     )
     await bot.edit_message_text(
@@ -313,135 +363,196 @@ async def handler_create_date(message: Message, state: FSMContext, bot: Bot):
     )
     await state.set_state(user_remind.message_remind)
 
+REPEAT_PROMPT = (
+    '<b># How often should it repeat? Pick a button or type: once, daily, weekdays, '
+    'weekly mon,fri, every 6h, cron 0 9 * * 1-5 #</b>'
+)
+
 @router.message(user_remind.message_remind)
 async def handler_create_message(message: Message, state: FSMContext, bot: Bot):
     await message.delete()
-    telegram_id = message.from_user.id
     data = await state.get_data()
     reminder_message_id = data.get("reminder_message_id")
     name_remind = data.get('name_remind')
-    time_remind = data.get('time_remind')
+    time_remind_str = data.get('time_remind_str')
     message_remind = message.text
-    await create_user_remind(
-        telegram_id=telegram_id,
-        title=name_remind,
-        reminder_time=time_remind,
-        message=message_remind
+    await state.update_data(message_remind=message_remind)
+    new_text = (
+        '<b>📌 Create a new reminder</b>\n\n'
+        f'<b>✅ | 📝 Reminder name:</b> <b>{name_remind}</b>\n'
+        f'<b>✅ | ⏰ Time to receive reminder: </b> <b>{time_remind_str}</b>\n'
+        f'<b>✅ | 💬 Reminder message: </b> <b>{message_remind}</b>\n'
+        '<b>❌ | 🔁 Repeat: </b>\n\n'
     )
-    new_list_text = await get_reminders_list_text(telegram_id)
-    success_text = "✅ The reminder has been successfully created."
-    final_text = new_list_text + "\n\n" + success_text
-    if reminder_message_id:
+    await bot.edit_message_text(
+        chat_id=message.chat.id,
+        message_id=reminder_message_id,
+        text=new_text + REPEAT_PROMPT,
+        parse_mode=ParseMode.HTML,
+        reply_markup=kb.repeat_keyboard()
+    )
+    await state.set_state(user_remind.repeat_remind)
+
+@router.message(user_remind.repeat_remind)
+async def handler_create_repeat(message: Message, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
+    await message.delete()
+    await finish_create(message.chat.id, message.text, state, bot, user_ctx, session)
+
+@router.callback_query(user_remind.repeat_remind, F.data.startswith("repeat:"))
+async def handler_create_repeat_button(callback: CallbackQuery, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
+    await callback.answer()
+    await finish_create(callback.message.chat.id, callback.data.split(":", 1)[1], state, bot, user_ctx, session)
+
+async def show_list_message(bot: Bot, chat_id: int, message_id: int, text: str, page, parse_mode: str = None):
+    # сообщение сценария могли удалить или его уже нельзя править — тогда отправляем новое
+    if message_id:
         try:
             await bot.edit_message_text(
-                chat_id=message.chat.id,
-                message_id=reminder_message_id,
-                text=final_text,
-                reply_markup=kb.remind_keyboard
+                chat_id=chat_id,
+                message_id=message_id,
+                text=text,
+                parse_mode=parse_mode,
+                reply_markup=kb.reminders_list_keyboard(page)
             )
+            return
         except Exception:
-            await message.answer(final_text, reply_markup=kb.remind_keyboard)
-    else:
-        await message.answer(final_text, reply_markup=kb.remind_keyboard)
+            pass
+    await bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=kb.reminders_list_keyboard(page))
+
+async def finish_create(chat_id: int, repeat_text: str, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
+    data = await state.get_data()
+    reminder_message_id = data.get("reminder_message_id")
+    time_remind = datetime.fromisoformat(data.get('time_remind'))
+    try:
+        recurrence = parse_rule(repeat_text, time_remind.astimezone(user_ctx.tz))
+    except ValueError:
+        error_text = "❌ Unknown repeat rule. Try again."
+        await bot.edit_message_text(
+            chat_id=chat_id, message_id=reminder_message_id,
+            text=f"{error_text}\n\n{REPEAT_PROMPT}", parse_mode=ParseMode.HTML, reply_markup=kb.repeat_keyboard()
+        )
+        return
+    reminder = await create_user_remind(
+        session,
+        user_id=user_ctx.id,
+        title=data.get('name_remind'),
+        reminder_time=time_remind,
+        message=data.get('message_remind'),
+        recurrence=recurrence
+    )
+    after_commit(session, lambda: scheduler.schedule(reminder.id, reminder.reminder_time))
+    new_list_text, page = await get_reminders_list(session, user_ctx)
+    success_text = "✅ The reminder has been successfully created."
+    final_text = new_list_text + "\n\n" + success_text
+    after_commit(session, lambda: show_list_message(bot, chat_id, reminder_message_id, final_text, page))
+    await state.clear()
+
+IMPORT_HELP = (
+    "📥 Send a CSV or iCalendar (.ics) file.\n\n"
+    "CSV columns: <code>title,time,message,repeat</code> (header optional, repeat optional), "
+    "time as <code>YYYY-MM-DD HH:MM</code> in your time zone."
+)
+
+@router.message(user_remind.import_file, F.document)
+@router.message(Command("import"), F.document)
+async def handler_import(message: Message, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
+    document = message.document
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.answer(f"❌ The file is too large (max {IMPORT_MAX_BYTES // (1024 * 1024)} MB).")
+        return
+    name = (document.file_name or "").lower()
+    kind = "ics" if name.endswith(".ics") or document.mime_type == "text/calendar" else "csv"
+    file = await bot.get_file(document.file_id)
+    chunks = bot.session.stream_content(bot.session.api.file_url(bot.token, file.file_path))
+    result = await import_reminders(session, user_ctx, chunks, kind, IMPORT_CHUNK_SIZE, IMPORT_MAX_ROWS)
+    logger.info("Reminders imported", extra={"telegram_id": user_ctx.telegram_id, "accepted": result.accepted, "rejected": result.rejected})
+    lines = [f"✅ Imported: {result.accepted}", f"❌ Rejected: {result.rejected}"]
+    lines.extend(result.errors)
+    response, page = await get_reminders_list(session, user_ctx)
+    await message.answer("\n".join(lines) + "\n\n" + response, reply_markup=kb.reminders_list_keyboard(page))
     await state.clear()
 
+@router.message(Command("import"))
+async def command_import(message: Message, state: FSMContext):
+    await message.answer(IMPORT_HELP, parse_mode=ParseMode.HTML, reply_markup=kb.back_keyboard)
+    await state.set_state(user_remind.import_file)
+
+@router.message(Command("digest"))
+async def command_digest(message: Message, user_ctx: UserContext, session: AsyncSession):
+    args = (message.text or "").split()[1:]
+    if len(args) != 1 or not args[0].isdigit() or int(args[0]) > 24 * 60:
+        await message.answer("Usage: /digest N — N minutes from 0 (off) to 1440.")
+        return
+    minutes = int(args[0])
+    await set_digest_window(session, user_ctx.telegram_id, minutes * 60)
+    if minutes:
+        reply = f"✅ Reminders due within {minutes} min of each other will arrive as one message."
+    else:
+        reply = "✅ Digest is off: every reminder arrives separately."
+    after_commit(session, lambda: message.answer(reply))
+
 @router.message(Command('register'))
-async def command_register(message: Message, state: FSMContext):
-    await message.answer('Please select your time zone from the list (you need to select the same time as you are currently on)🕒', reply_markup=kb.create_utc_times_keyboard())
+async def command_register(message: Message, state: FSMContext, session: AsyncSession):
+    await resume_user(session, message.from_user.id)
+    after_commit(session, lambda: message.answer('Please select your time zone from the list (you need to select the same time as you are currently on)🕒', reply_markup=kb.create_utc_times_keyboard()))
 
 @router.callback_query(F.data.regexp(r"^[+-]?\d{1,2}$"))
-async def handle_timezone_callback(callback: CallbackQuery):
+async def handle_timezone_callback(callback: CallbackQuery, session: AsyncSession):
     user_timezone = callback.data
     telegram_id = callback.from_user.id
-    await callback.message.answer(f"✅Great! You are now registered and can start using the bot. If you need to change your time zone, simply run the /register command again.\n "
-                                  f"Your time zone at the moment UTC{user_timezone}")
     await callback.answer()
-    await create_or_update_user(telegram_id, user_timezone)
+    if await create_or_update_user(session, telegram_id, user_timezone) is None:
+        after_commit(session, lambda: callback.message.answer("❌ Registration failed, please try /register again."))
+        return
+    after_commit(session, lambda: callback.message.answer(
+        f"✅Great! You are now registered and can start using the bot. If you need to change your time zone, simply run the /register command again.\n "
+        f"Your time zone at the moment UTC{user_timezone}"
+    ))
 
-@router.callback_query(F.data == "edit")
-async def command_edit(callback: CallbackQuery, state: FSMContext):
-    await callback.answer()
-    telegram_id = callback.from_user.id
-    reminders = await get_user_reminders(telegram_id)
-    if not reminders:
-        await callback.message.edit_text("🗒 You don't have any reminders yet.", reply_markup=kb.back_keyboard)
+@router.callback_query(F.data.startswith("edit:"))
+async def handler_edit_select(callback: CallbackQuery, state: FSMContext, user_ctx: UserContext, session: AsyncSession):
+    reminder_id, _ = parse_pick(callback.data)
+    reminder = await get_reminder(session, reminder_id, user_ctx.id)
+    if not reminder:
+        await callback.answer("❌ This reminder no longer exists.", show_alert=True)
         return
+    await callback.answer()
+    local_dt = reminder['reminder_time'].astimezone(user_ctx.tz)
+    local_time_str = local_dt.strftime("%Y-%m-%d %H:%M")
     await state.update_data(
-        full_reminders=reminders,
-        list_message_id=callback.message.message_id
+        list_message_id=callback.message.message_id,
+        editing_reminder_id=reminder['id'],
+        editing_reminder_title=reminder['title'],
+        editing_reminder_time=reminder['reminder_time'].isoformat()
     )
-    list_text = await get_reminders_list_text(telegram_id)
-    prompt_text = "\n\nEnter the number of the reminder you want to edit:"
-    await callback.message.edit_text(list_text + prompt_text, reply_markup=kb.back_keyboard)
-    await state.set_state(user_remind.edit_index)
-
-@router.message(user_remind.edit_index)
-async def handler_edit_select(message: Message, state: FSMContext, bot: Bot):
-    await message.delete()
-    data = await state.get_data()
-    reminders = data.get("full_reminders", [])
-    list_message_id = data.get("list_message_id")
-    telegram_id = message.from_user.id
-    try:
-        index = int(message.text.strip()) - 1
-        if index < 0 or index >= len(reminders):
-            raise ValueError
-        reminder = reminders[index]
-        async with async_session() as session:
-            result = await session.execute(select(User.timezone).where(User.telegram_id == telegram_id))
-            timezone_offset_str = result.scalar()
-        timezone_offset = int(timezone_offset_str)
-        tz = pytz.FixedOffset(timezone_offset * 60)
-        local_dt = reminder['reminder_time'].astimezone(tz)
-        local_time_str = local_dt.strftime("%Y-%m-%d %H:%M")
-        await state.update_data(
-            editing_reminder_id=reminder['id'],
-            editing_reminder_title=reminder['title'],
-            editing_reminder_time=reminder['reminder_time'],
-            editing_reminder_message=reminder['message'],
-            timezone_offset=timezone_offset
-        )
-        edit_form_text = (
-            '<b>✏️ Edit reminder</b>\n\n'
-            f'<b>✅ | 📝 Reminder name:</b>\n <b>{reminder["title"]}</b>\n'
-            f'<b>✅ | ⏰ Time to receive reminder: </b>\n<b>{local_time_str}</b>\n'
-            f'<b>✅ | 💬 Reminder message: </b>\n<b>{reminder["message"]}</b>\n\n'
-            '<b># Enter a new name for the reminder (or send the same to keep it). #</b>'
-        )
-        await bot.edit_message_text(
-            chat_id=message.chat.id,
-            message_id=list_message_id,
-            text=edit_form_text,
-            parse_mode=ParseMode.HTML,
-            reply_markup=kb.back_keyboard
-        )
-        await state.set_state(user_remind.edit_name)
-    except (ValueError, IndexError):
-        list_text = await get_reminders_list_text(telegram_id)
-        error_text = "❌ Invalid number. Try again."
-        await bot.edit_message_text(
-            chat_id=message.chat.id,
-            message_id=list_message_id,
-            text=f"{list_text}\n\n{error_text}",
-            reply_markup=kb.back_keyboard
-        )
+    edit_form_text = (
+        '<b>✏️ Edit reminder</b>\n\n'
+        f'<b>✅ | 📝 Reminder name:</b>\n <b>{reminder["title"]}</b>\n'
+        f'<b>✅ | ⏰ Time to receive reminder: </b>\n<b>{local_time_str}</b>\n'
+        f'<b>✅ | 💬 Reminder message: </b>\n<b>{reminder["message"]}</b>\n'
+        f'<b>✅ | 🔁 Repeat: </b>\n<b>{describe(reminder["recurrence"])}</b>\n\n'
+        '<b># Enter a new name for the reminder (or send the same to keep it). #</b>'
+    )
+    await callback.message.edit_text(edit_form_text, parse_mode=ParseMode.HTML, reply_markup=kb.back_keyboard)
+    await state.set_state(user_remind.edit_name)
 
 @router.message(user_remind.edit_name)
-async def handler_edit_name(message: Message, state: FSMContext, bot: Bot):
+async def handler_edit_name(message: Message, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
     await message.delete()
     new_name = message.text
     data = await state.get_data()
     list_message_id = data.get("list_message_id")
-    timezone_offset = data.get('timezone_offset')
-    tz = pytz.FixedOffset(timezone_offset * 60)
-    original_time_utc = data.get('editing_reminder_time')
-    original_time_local_str = original_time_utc.astimezone(tz).strftime("%Y-%m-%d %H:%M")
-    original_message = data.get('editing_reminder_message')
+    original_time_utc = datetime.fromisoformat(data.get('editing_reminder_time'))
+    original_time_local_str = original_time_utc.astimezone(user_ctx.tz).strftime("%Y-%m-%d %H:%M")
+    original = await get_reminder(session, data.get('editing_reminder_id'), user_ctx.id)
+    original_message = original['message'] if original else ''
+    original_repeat = describe(original['recurrence'] if original else None)
     base_text = (
         '<b>✏️ Edit reminder</b>\n\n'
         f'<b>✅ | 📝 Reminder name:</b>\n <b>{new_name}</b>\n'
         f'<b>✅ | ⏰ Time to receive reminder: </b>\n<b>{original_time_local_str}</b>\n'
-        f'<b>✅ | 💬 Reminder message: </b>\n<b>{original_message}</b>\n\n'
+        f'<b>✅ | 💬 Reminder message: </b>\n<b>{original_message}</b>\n'
+        f'<b>✅ | 🔁 Repeat: </b>\n<b>{original_repeat}</b>\n\n'
     )
     if len(new_name) > 20:
         error_text = "❌ The reminder name must not exceed 20 characters. Please enter a shorter name."
@@ -462,40 +573,39 @@ async def handler_edit_name(message: Message, state: FSMContext, bot: Bot):
     await state.set_state(user_remind.edit_time)
 
 @router.message(user_remind.edit_time)
-async def handler_edit_time(message: Message, state: FSMContext, bot: Bot):
+async def handler_edit_time(message: Message, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
     await message.delete()
     data = await state.get_data()
     list_message_id = data.get("list_message_id")
     name_remind = data.get('editing_reminder_title')
-    original_message = data.get('editing_reminder_message')
+    original = await get_reminder(session, data.get('editing_reminder_id'), user_ctx.id)
+    original_message = original['message'] if original else ''
+    original_repeat = describe(original['recurrence'] if original else None)
+    old_time_utc = datetime.fromisoformat(data.get('editing_reminder_time'))
     time_remind_str = message.text.strip()
     base_text_template = (
         '<b>✏️ Edit reminder</b>\n\n'
         f'<b>✅ | 📝 Reminder name:</b>\n <b>{name_remind}</b>\n'
         '<b>✅ | ⏰ Time to receive reminder: </b>\n<b>{time_str}</b>\n'
-        f'<b>✅ | 💬 Reminder message: </b>\n<b>{original_message}</b>\n\n'
+        f'<b>✅ | 💬 Reminder message: </b>\n<b>{original_message}</b>\n'
+        f'<b>✅ | 🔁 Repeat: </b>\n<b>{original_repeat}</b>\n\n'
     )
     try:
         dt_naive = datetime.strptime(time_remind_str, '%Y-%m-%d %H:%M')
     except ValueError:
         error_text = "❌ Invalid time format. Please enter in format: <b>YYYY-MM-DD HH:MM</b>"
-        timezone_offset = data.get('timezone_offset')
-        tz = pytz.FixedOffset(timezone_offset * 60)
-        old_time_utc = data.get('editing_reminder_time')
-        old_time_local_str = old_time_utc.astimezone(tz).strftime("%Y-%m-%d %H:%M")
+        old_time_local_str = old_time_utc.astimezone(user_ctx.tz).strftime("%Y-%m-%d %H:%M")
         base_text = base_text_template.format(time_str=old_time_local_str)
         await bot.edit_message_text(
             chat_id=message.chat.id, message_id=list_message_id,
             text=f"{error_text}\n\n{base_text}", parse_mode="HTML", reply_markup=kb.back_keyboard
         )
         return
-    timezone_offset = data.get('timezone_offset')
-    tz = pytz.FixedOffset(timezone_offset * 60)
+    tz = user_ctx.tz
     dt_local = tz.localize(dt_naive)
     now_local = datetime.now(tz)
     if dt_local < now_local:
         error_text = "❌ The specified time has already passed. Please enter a future time."
-        old_time_utc = data.get('editing_reminder_time')
         old_time_local_str = old_time_utc.astimezone(tz).strftime("%Y-%m-%d %H:%M")
         base_text = base_text_template.format(time_str=old_time_local_str)
         await bot.edit_message_text(
@@ -504,7 +614,7 @@ async def handler_edit_time(message: Message, state: FSMContext, bot: Bot):
         )
         return
     dt_utc = dt_local.astimezone(pytz.UTC)
-    await state.update_data(editing_reminder_time=dt_utc)
+    await state.update_data(editing_reminder_time=dt_utc.isoformat())
     prompt_text = '<b># Enter a new message for the reminder. #</b>'
     new_base_text = base_text_template.format(time_str=time_remind_str)
     await bot.edit_message_text(
@@ -517,35 +627,75 @@ async def handler_edit_time(message: Message, state: FSMContext, bot: Bot):
     await state.set_state(user_remind.edit_message)
 
 @router.message(user_remind.edit_message)
-async def handler_edit_message(message: Message, state: FSMContext, bot: Bot):
+async def handler_edit_message(message: Message, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
     await message.delete()
-    telegram_id = message.from_user.id
     data = await state.get_data()
     list_message_id = data.get("list_message_id")
     name_remind = data.get('editing_reminder_title')
-    time_remind_utc = data.get('editing_reminder_time')
+    time_remind_utc = datetime.fromisoformat(data.get('editing_reminder_time'))
     message_remind = message.text
+    original = await get_reminder(session, data.get('editing_reminder_id'), user_ctx.id)
+    original_repeat = describe(original['recurrence'] if original else None)
+    await state.update_data(editing_reminder_message=message_remind)
+    base_text = (
+        '<b>✏️ Edit reminder</b>\n\n'
+        f'<b>✅ | 📝 Reminder name:</b>\n <b>{name_remind}</b>\n'
+        f'<b>✅ | ⏰ Time to receive reminder: </b>\n<b>{time_remind_utc.astimezone(user_ctx.tz).strftime("%Y-%m-%d %H:%M")}</b>\n'
+        f'<b>✅ | 💬 Reminder message: </b>\n<b>{message_remind}</b>\n'
+        f'<b>✅ | 🔁 Repeat: </b>\n<b>{original_repeat}</b>\n\n'
+    )
+    await bot.edit_message_text(
+        chat_id=message.chat.id,
+        message_id=list_message_id,
+        text=base_text + REPEAT_PROMPT,
+        parse_mode=ParseMode.HTML,
+        reply_markup=kb.repeat_keyboard(keep=True)
+    )
+    await state.set_state(user_remind.edit_repeat)
+
+@router.message(user_remind.edit_repeat)
+async def handler_edit_repeat(message: Message, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
+    await message.delete()
+    await finish_edit(message.chat.id, message.text, state, bot, user_ctx, session)
+
+@router.callback_query(user_remind.edit_repeat, F.data.startswith("repeat:"))
+async def handler_edit_repeat_button(callback: CallbackQuery, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
+    await callback.answer()
+    await finish_edit(callback.message.chat.id, callback.data.split(":", 1)[1], state, bot, user_ctx, session)
+
+async def finish_edit(chat_id: int, repeat_text: str, state: FSMContext, bot: Bot, user_ctx: UserContext, session: AsyncSession):
+    data = await state.get_data()
+    list_message_id = data.get("list_message_id")
+    time_remind_utc = datetime.fromisoformat(data.get('editing_reminder_time'))
     editing_reminder_id = data.get('editing_reminder_id')
-    await update_reminder_by_id(
+    try:
+        if repeat_text.strip().lower() == "keep":
+            original = await get_reminder(session, editing_reminder_id, user_ctx.id)
+            recurrence = original['recurrence'] if original else None
+        else:
+            recurrence = parse_rule(repeat_text, time_remind_utc.astimezone(user_ctx.tz))
+    except ValueError:
+        error_text = "❌ Unknown repeat rule. Try again."
+        await bot.edit_message_text(
+            chat_id=chat_id, message_id=list_message_id,
+            text=f"{error_text}\n\n{REPEAT_PROMPT}", parse_mode=ParseMode.HTML, reply_markup=kb.repeat_keyboard(keep=True)
+        )
+        return
+    reminder = await update_reminder_by_id(
+        session,
         reminder_id=editing_reminder_id,
-        title=name_remind,
+        user_id=user_ctx.id,
+        title=data.get('editing_reminder_title'),
         reminder_time=time_remind_utc,
-        message=message_remind
+        message=data.get('editing_reminder_message'),
+        recurrence=recurrence
     )
-    final_list = await get_reminders_list_text(telegram_id)
+    if reminder:
+        after_commit(session, lambda: scheduler.schedule(reminder.id, reminder.reminder_time))
+    else:
+        after_commit(session, lambda: scheduler.cancel(editing_reminder_id))
+    final_list, page = await get_reminders_list(session, user_ctx)
     success_text = "✅ The reminder has been successfully updated."
     final_text = final_list + "\n\n" + success_text
-    if list_message_id:
-        try:
-            await bot.edit_message_text(
-                chat_id=message.chat.id,
-                message_id=list_message_id,
-                text=final_text,
-                parse_mode=ParseMode.HTML,
-                reply_markup=kb.remind_keyboard
-            )
-        except Exception:
-            await message.answer(final_text, reply_markup=kb.remind_keyboard, parse_mode=ParseMode.HTML)
-    else:
-        await message.answer(final_text, reply_markup=kb.remind_keyboard, parse_mode=ParseMode.HTML)
-    await state.clear()
\ No newline at end of file
+    after_commit(session, lambda: show_list_message(bot, chat_id, list_message_id, final_text, page, ParseMode.HTML))
+    await state.clear()
@@ -0,0 +1,212 @@
+import codecs
+import csv
+import re
+from datetime import datetime, timezone, tzinfo
+from typing import AsyncIterator, List, NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import UserContext, bulk_create_reminders
+from recurrence import next_occurrence, parse_rule
+from scheduler import scheduler
+
+TITLE_MAX_LENGTH = 20
+ICS_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+
+class ImportResult(NamedTuple):
+    accepted: int
+    rejected: int
+    errors: List[str]  # первые несколько причин отказа, "line N: ..."
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    # файл не собирается в памяти целиком: декодируем и режем на строки по мере скачивания
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    tail = ""
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail.rstrip("\r")
+
+
+def _parse_local_time(value: str, tz: tzinfo) -> datetime:
+    value = value.strip()
+    try:
+        return tz.localize(datetime.strptime(value, "%Y-%m-%d %H:%M"))
+    except ValueError:
+        pass
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"invalid time {value!r}, expected YYYY-MM-DD HH:MM")
+    return tz.localize(dt) if dt.tzinfo is None else dt
+
+
+def _first_fire(reminder_time: datetime, recurrence: Optional[str], tz: tzinfo, now: datetime) -> datetime:
+    # прошедшее время допустимо только для повторяющихся: берём ближайшее будущее срабатывание
+    if reminder_time > now:
+        return reminder_time
+    if recurrence:
+        next_time = next_occurrence(recurrence, reminder_time, tz, now)
+        if next_time:
+            return next_time
+    raise ValueError("time has already passed")
+
+
+def _build(title: str, reminder_time: datetime, message: str, recurrence: Optional[str], tz: tzinfo, now: datetime) -> dict:
+    title = title.strip()
+    if not title:
+        raise ValueError("empty title")
+    return {
+        "title": title[:TITLE_MAX_LENGTH].rstrip(),
+        "reminder_time": _first_fire(reminder_time, recurrence, tz, now).astimezone(timezone.utc),
+        "message": message.strip(),
+        "recurrence": recurrence,
+    }
+
+
+async def parse_csv(lines: AsyncIterator[str], tz: tzinfo):
+    # title,time,message[,repeat]; заголовок необязателен, время — в часовом поясе пользователя
+    columns = ["title", "time", "message", "repeat"]
+    now = datetime.now(timezone.utc)
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if line_no == 1 and {"title", "time"} <= {v.strip().lower() for v in values}:
+            columns = [v.strip().lower() for v in values]
+            continue
+        row = dict(zip(columns, values))
+        try:
+            reminder_time = _parse_local_time(row.get("time", ""), tz)
+            recurrence = parse_rule(row["repeat"], reminder_time.astimezone(tz)) if row.get("repeat", "").strip() else None
+            yield line_no, _build(row.get("title", ""), reminder_time, row.get("message", ""), recurrence, tz, now), None
+        except (ValueError, KeyError) as e:
+            yield line_no, None, str(e)
+
+
+def _parse_ics_time(name: str, value: str, tz: tzinfo) -> datetime:
+    params = dict(p.split("=", 1) for p in name.split(";")[1:] if "=" in p)
+    if params.get("VALUE") == "DATE" or len(value) == 8:
+        return tz.localize(datetime.strptime(value, "%Y%m%d"))
+    if value.endswith("Z"):
+        return datetime.strptime(value, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    dt = datetime.strptime(value, "%Y%m%dT%H%M%S")
+    if "TZID" in params:
+        try:
+            return dt.replace(tzinfo=ZoneInfo(params["TZID"].strip('"')))
+        except (KeyError, ValueError):
+            pass
+    # «плавающее» время — в часовом поясе пользователя
+    return tz.localize(dt)
+
+
+def _rrule_to_recurrence(rrule: str, first_time: datetime) -> Optional[str]:
+    parts = dict(p.split("=", 1) for p in rrule.split(";") if "=" in p)
+    freq = parts.get("FREQ")
+    interval = int(parts.get("INTERVAL", 1))
+    if freq == "HOURLY":
+        return f"hours:{interval}"
+    if freq == "DAILY" and interval == 1:
+        return "daily"
+    if freq == "WEEKLY" and interval == 1:
+        days = [re.sub(r"^[+-]?\d+", "", d) for d in parts.get("BYDAY", "").split(",") if d]
+        if not days:
+            return f"weekly:{first_time.weekday()}"
+        return "weekly:" + ",".join(str(i) for i in sorted({ICS_WEEKDAYS.index(d) for d in days}))
+    raise ValueError(f"unsupported RRULE: {rrule}")
+
+
+def _ics_unescape(value: str) -> str:
+    return value.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\")
+
+
+async def _unfold(lines: AsyncIterator[str]):
+    # RFC 5545: строка, начинающаяся с пробела или таба, продолжает предыдущую
+    current, current_no, line_no = None, 0, 0
+    async for line in lines:
+        line_no += 1
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current_no, current
+        current, current_no = line, line_no
+    if current is not None:
+        yield current_no, current
+
+
+async def parse_ics(lines: AsyncIterator[str], tz: tzinfo):
+    # берём только VEVENT: SUMMARY, DTSTART, DESCRIPTION и простые RRULE
+    now = datetime.now(timezone.utc)
+    event, event_line = None, 0
+    async for line_no, line in _unfold(lines):
+        if line == "BEGIN:VEVENT":
+            event, event_line = {}, line_no
+            continue
+        if event is None:
+            continue
+        if line == "END:VEVENT":
+            try:
+                if "DTSTART" not in event:
+                    raise ValueError("missing DTSTART")
+                name, value = event["DTSTART"]
+                reminder_time = _parse_ics_time(name, value, tz)
+                recurrence = _rrule_to_recurrence(event["RRULE"][1], reminder_time.astimezone(tz)) if "RRULE" in event else None
+                summary = _ics_unescape(event.get("SUMMARY", ("", ""))[1])
+                description = _ics_unescape(event.get("DESCRIPTION", ("", ""))[1])
+                yield event_line, _build(summary, reminder_time, description or summary, recurrence, tz, now), None
+            except ValueError as e:
+                yield event_line, None, str(e)
+            event = None
+            continue
+        name, _, value = line.partition(":")
+        event.setdefault(name.split(";", 1)[0].upper(), (name, value))
+
+
+async def import_reminders(
+    session: AsyncSession,
+    user_ctx: UserContext,
+    chunks: AsyncIterator[bytes],
+    kind: str,
+    chunk_size: int,
+    max_rows: int,
+    max_errors: int = 5
+) -> ImportResult:
+    parser = parse_ics if kind == "ics" else parse_csv
+    accepted, rejected, errors, batch = 0, 0, [], []
+
+    async def flush():
+        created = await bulk_create_reminders(session, user_ctx.id, batch)
+        # коммит на каждую пачку: соединение возвращается в пул, пока докачивается остаток файла
+        await session.commit()
+        for reminder_id, reminder_time in created:
+            scheduler.schedule(reminder_id, reminder_time)
+        batch.clear()
+
+    async for line_no, reminder, error in parser(iter_lines(chunks), user_ctx.tz):
+        if reminder is None:
+            rejected += 1
+            if len(errors) < max_errors:
+                errors.append(f"line {line_no}: {error}")
+            continue
+        if accepted >= max_rows:
+            rejected += 1
+            if len(errors) < max_errors:
+                errors.append(f"line {line_no}: import limit of {max_rows} reminders reached")
+            continue
+        batch.append(reminder)
+        accepted += 1
+        if len(batch) >= chunk_size:
+            await flush()
+    if batch:
+        await flush()
+    return ImportResult(accepted, rejected, errors)
@@ -1,16 +1,76 @@
 from datetime import datetime, timedelta, timezone
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-remind_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-    [
-        InlineKeyboardButton(text="Create➕", callback_data="create"),
-        InlineKeyboardButton(text="Delete🗑️", callback_data="delete")
-    ],
-    [
-        InlineKeyboardButton(text="Show👁️", callback_data="show"),
-        InlineKeyboardButton(text="Edit✏️", callback_data="edit")
-    ]
-])
+# действие над выбранным напоминанием -> префикс callback_data кнопки с его id
+PICK_ACTIONS = {"show": "show", "delete": "del", "edit": "edit"}
+
+def encode_cursor(cursor: tuple) -> str:
+    if not cursor:
+        return ""
+    reminder_time, reminder_id = cursor
+    return f"{int(reminder_time.timestamp())}:{reminder_id}"
+
+def decode_cursor(value: str) -> tuple:
+    if not value:
+        return None
+    timestamp, reminder_id = value.split(":")
+    return datetime.fromtimestamp(int(timestamp), timezone.utc), int(reminder_id)
+
+def reminders_list_keyboard(page) -> InlineKeyboardMarkup:
+    # кнопки действий несут курсор страницы, чтобы выбор открылся на ней же без состояния в FSM
+    cursor = encode_cursor(page.start)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="Create➕", callback_data="create"),
+            InlineKeyboardButton(text="Delete🗑️", callback_data=f"pick:delete:at:{cursor}")
+        ],
+        [
+            InlineKeyboardButton(text="Show👁️", callback_data=f"pick:show:at:{cursor}"),
+            InlineKeyboardButton(text="Edit✏️", callback_data=f"pick:edit:at:{cursor}")
+        ]
+    ])
+    row = []
+    if page.has_prev:
+        row.append(InlineKeyboardButton(text="⬅️ Prev", callback_data=f"list:prev:{encode_cursor(page.start)}"))
+    if page.next_start:
+        row.append(InlineKeyboardButton(text="Next ➡️", callback_data=f"list:next:{encode_cursor(page.next_start)}"))
+    if row:
+        keyboard.inline_keyboard.append(row)
+    return keyboard
+
+def reminders_pick_keyboard(page, action: str) -> InlineKeyboardMarkup:
+    # по кнопке на напоминание: callback_data = "<действие>:<id>:<курсор страницы>"
+    prefix = PICK_ACTIONS[action]
+    cursor = encode_cursor(page.start)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{i}. {r['title']}", callback_data=f"{prefix}:{r['id']}:{cursor}")]
+        for i, r in enumerate(page.reminders, start=1)
+    ])
+    row = []
+    if page.has_prev:
+        row.append(InlineKeyboardButton(text="⬅️ Prev", callback_data=f"pick:{action}:before:{encode_cursor(page.start)}"))
+    if page.next_start:
+        row.append(InlineKeyboardButton(text="Next ➡️", callback_data=f"pick:{action}:at:{encode_cursor(page.next_start)}"))
+    if row:
+        keyboard.inline_keyboard.append(row)
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Back", callback_data=f"list:at:{cursor}")])
+    return keyboard
+
+def repeat_keyboard(keep: bool = False) -> InlineKeyboardMarkup:
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="Once", callback_data="repeat:once"),
+            InlineKeyboardButton(text="Daily", callback_data="repeat:daily")
+        ],
+        [
+            InlineKeyboardButton(text="Weekdays", callback_data="repeat:weekdays"),
+            InlineKeyboardButton(text="Weekly", callback_data="repeat:weekly")
+        ]
+    ])
+    if keep:
+        keyboard.inline_keyboard.append([InlineKeyboardButton(text="Keep as is", callback_data="repeat:keep")])
+    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Back", callback_data="back_to_list")])
+    return keyboard
 
 back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [
@@ -18,6 +78,11 @@ back_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     ]
 ])
 
+def back_to_page_keyboard(cursor: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Back", callback_data=f"list:at:{cursor}")]
+    ])
+
 def create_utc_times_keyboard():
     now_utc = datetime.now(timezone.utc)  # aware datetime
     offsets = list(range(-12, 13))
@@ -1,74 +1,246 @@
 import asyncio
 import logging
-import sys
 import os
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiohttp import web
-from datetime import datetime, timezone
 
 from handlers import router
-from config import BOT_TOKEN
-from database import init_db, get_all_reminders_all, delete_reminder_by_id
-from handlers import RegistrationMiddleware
+from config import (
+    BOT_TOKEN, CLEANER_BATCH_SIZE, DELIVERY_WORKERS, DELIVERY_QUEUE_SIZE,
+    DELIVERY_GLOBAL_RATE, DELIVERY_CHAT_RATE, DELIVERY_CHAT_BURST, DELIVERY_MAX_RETRIES,
+    DELIVERY_MAX_ATTEMPTS, DELIVERY_BACKOFF_BASE, DELIVERY_BACKOFF_MAX, WORKER_ID, CLAIM_LEASE_SECONDS,
+    FSM_STORAGE, FSM_STATE_TTL, FSM_PURGE_INTERVAL, REDIS_URL, DB_POOL_WARM, REPLICA_HEALTH_INTERVAL,
+    LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATE, LOG_FORMAT,
+    WEBHOOK_INGESTION, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE, WEBHOOK_DEDUP_SIZE,
+    FLOOD_USER_RATE, FLOOD_USER_BURST, FLOOD_GLOBAL_RATE, FLOOD_GLOBAL_BURST, FLOOD_MAX_USERS
+)
+from database import warm_pool, pool_stats, engine, replica, user_cache, claim_due_reminders, extend_claims, finalize_reminders, record_delivery_failure, deactivate_user
+from handlers import RegistrationMiddleware, HandlerMetricsMiddleware, DbSessionMiddleware, FloodControlMiddleware
+from scheduler import scheduler
+from delivery import DeliveryPipeline
+from storage import create_storage, DatabaseStorage
+from logs import setup_logging
+from webhook import QueuedRequestHandler
+from migrations import check_schema
+import metrics
+import time
 
-async def reminder_cleaner(bot: Bot):
+logger = logging.getLogger("main")
+_tasks = []  # фоновые задачи процесса: без ссылки на задачу её может собрать сборщик мусора
+_reported = {"sent": 0, "failed": 0}  # счётчики конвейера на момент прошлой сводки
+
+async def deliver_due_reminders(pipeline: DeliveryPipeline):
+    # одна сводная строка на тик вместо строки на каждое напоминание
+    started = time.perf_counter()
+    due = 0
+    while True:
+        claim_started = time.perf_counter()
+        reminders = await claim_due_reminders(WORKER_ID, CLEANER_BATCH_SIZE, CLAIM_LEASE_SECONDS)
+        metrics.cleaner_tick.observe(time.perf_counter() - claim_started)
+        metrics.cleaner_due.observe(len(reminders))
+        due += len(reminders)
+        # строки, которые уже ждут отправки в этом процессе, второй раз в очередь не ставим
+        for batch in group_by_chat([r for r in reminders if r.id not in pipeline.claimed]):
+            await pipeline.submit(batch)
+        # полная пачка — сразу забираем следующую
+        if len(reminders) < CLEANER_BATCH_SIZE:
+            break
+    # sent/failed — доставки, завершившиеся с прошлой сводки
+    logger.info("Cleaner tick", extra={
+        "worker": WORKER_ID,
+        "due": due,
+        "sent": pipeline.sent - _reported["sent"],
+        "failed": pipeline.failed - _reported["failed"],
+        "queued": pipeline.qsize(),
+        "seconds": round(time.perf_counter() - started, 4),
+    })
+    _reported.update(sent=pipeline.sent, failed=pipeline.failed)
+
+def group_by_chat(reminders):
+    # пользователи с окном дайджеста получают свои напоминания одним сообщением
+    batches = {}
+    for reminder in reminders:
+        key = reminder.telegram_id if reminder.digest_window else (reminder.telegram_id, reminder.id)
+        batches.setdefault(key, []).append(reminder)
+    return batches.values()
+
+async def on_delivery_sent(reminder_ids):
+    rescheduled = await finalize_reminders(reminder_ids, WORKER_ID)
+    for reminder_id, next_time in rescheduled.items():
+        scheduler.schedule(reminder_id, next_time)
+
+async def on_delivery_failed(reminder_ids, error: str):
+    for reminder_id in reminder_ids:
+        next_time = await record_delivery_failure(
+            reminder_id,
+            WORKER_ID,
+            error,
+            max_attempts=DELIVERY_MAX_ATTEMPTS,
+            backoff_base=DELIVERY_BACKOFF_BASE,
+            backoff_max=DELIVERY_BACKOFF_MAX
+        )
+        if next_time:
+            scheduler.schedule(reminder_id, next_time)
+
+async def on_chat_unavailable(telegram_id: int, reminder_ids, error: str):
+    suspended = await deactivate_user(telegram_id)
+    # остальные напоминания этого чата, уже стоящие в очереди, не отправляем
+    pipeline.release(suspended)
+    for reminder_id in suspended:
+        scheduler.cancel(reminder_id)
+
+async def lease_renewer(pipeline: DeliveryPipeline):
+    # без продления строка, простоявшая в очереди дольше аренды, захватывается снова и уходит дважды
     while True:
-        reminders = await get_all_reminders_all()
-        now = datetime.now(timezone.utc)
-        print(f"[Cleaner] {len(reminders)} reminders found. Time now: {now.isoformat()}")
-        for reminder in reminders:
-            reminder_time = reminder.reminder_time
-            if reminder_time.tzinfo is None:
-                reminder_time = reminder_time.replace(tzinfo=timezone.utc)
-            if reminder_time <= now:
-                try:
-                    if not reminder.user or not reminder.user.telegram_id:
-                        print(f"[Cleaner] Reminder ID {reminder.id} has no valid user, skipping.")
-                        continue
-                    await bot.send_message(
-                        int(reminder.user.telegram_id),
-                        f"🔔 Reminder: {reminder.title}\n{reminder.message or ''}"
-                    )
-                    await delete_reminder_by_id(reminder.id)
-                    print(f"[Cleaner] Reminder ID {reminder.id} sent and deleted.")
-                except Exception as e:
-                    print(f"[Cleaner] Error sending reminder ID {reminder.id}: {e}")
-            else:
-                print(f"[Cleaner] Reminder ID {reminder.id} not due yet ({reminder_time.isoformat()})")
-        await asyncio.sleep(10)
+        await asyncio.sleep(CLAIM_LEASE_SECONDS / 3)
+        claimed = set(pipeline.claimed)
+        if not claimed:
+            continue
+        try:
+            owned = await extend_claims(WORKER_ID, claimed, CLAIM_LEASE_SECONDS)
+        except Exception:
+            logger.exception("Lease renewal failed")
+            continue
+        # завершённые за время запроса тоже не в owned — release для них ничего не меняет
+        lost = (claimed - owned) & pipeline.claimed
+        if lost:
+            logger.warning("Claims lost before delivery", extra={"worker": WORKER_ID, "reminder_ids": sorted(lost)[:20], "count": len(lost)})
+            pipeline.release(lost)
+
+async def fsm_purger(storage: DatabaseStorage):
+    while True:
+        await asyncio.sleep(FSM_PURGE_INTERVAL)
+        try:
+            purged = await storage.purge_expired()
+            stats = await storage.stats()
+            logger.info("FSM states purged", extra={"purged": purged, "keys": stats["keys"], "bytes": stats["bytes"]})
+        except Exception:
+            logger.exception("FSM purge failed")
+
+async def replica_monitor():
+    while True:
+        await replica.check()
+        await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+
+def start_background(coro):
+    task = asyncio.create_task(coro)
+    task.add_done_callback(_on_task_done)
+    _tasks.append(task)
+
+def _on_task_done(task: asyncio.Task):
+    # фоновые циклы не должны завершаться сами: падение хотя бы видно в логах
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task crashed", exc_info=task.exception(), extra={"task": task.get_coro().__name__})
+
+async def reminder_cleaner(pipeline: DeliveryPipeline):
+    await scheduler.run(lambda: deliver_due_reminders(pipeline))
 
 APP_URL = os.getenv("APP_URL", "").rstrip("/")
 WEBHOOK_PATH = f"/webhook/{BOT_TOKEN}"
 WEBHOOK_URL = f"{APP_URL}{WEBHOOK_PATH}"
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+bot.session.middleware(metrics.BotApiMetricsMiddleware())
+metrics.instrument_engine(engine)
+for name, documentation, collect in (
+    ("db_pool_checked_out", "Connections checked out of the pool", lambda: pool_stats()["checked_out"]),
+    ("db_pool_checkout_wait_max_seconds", "Longest pool checkout wait", lambda: pool_stats()["checkout_wait_max"]),
+    ("scheduler_heap_size", "Reminders held by the in-memory scheduler", lambda: len(scheduler)),
+    ("delivery_queue_size", "Reminders waiting in the delivery queue", lambda: pipeline.qsize()),
+):
+    metrics.registry.register(metrics.Gauge(name, documentation, collect))
+for name, documentation, collect in (
+    ("user_cache_hits_total", "User cache hits", lambda: user_cache.hits),
+    ("user_cache_misses_total", "User cache misses", lambda: user_cache.misses),
+):
+    metrics.registry.register(metrics.ObservedCounter(name, documentation, collect))
+if replica is not None:
+    metrics.instrument_engine(replica.engine)
+    for name, documentation, collect in (
+        ("db_replica_healthy", "1 while reads are routed to the replica", lambda: int(replica.healthy)),
+        ("db_replica_lag_seconds", "Replication lag seen by the last health check", lambda: replica.lag),
+    ):
+        metrics.registry.register(metrics.Gauge(name, documentation, collect))
+    for name, documentation, collect in (
+        ("db_replica_reads_total", "Queries served by the replica", lambda: replica.reads),
+        ("db_replica_fallbacks_total", "Replica queries retried on the primary", lambda: replica.fallbacks),
+    ):
+        metrics.registry.register(metrics.ObservedCounter(name, documentation, collect))
+
+storage = create_storage(FSM_STORAGE, FSM_STATE_TTL, REDIS_URL)
+# FSM-middleware регистрируем сами, после сессии апдейта: иначе состояние читается в отдельной сессии
+dp = Dispatcher(storage=storage, disable_fsm=True)
+# флуд режется первым: отброшенный апдейт не берёт соединение и не читает состояние FSM
+dp.update.outer_middleware(FloodControlMiddleware(
+    FLOOD_USER_RATE, FLOOD_USER_BURST, FLOOD_GLOBAL_RATE, FLOOD_GLOBAL_BURST, FLOOD_MAX_USERS
+))
+dp.update.outer_middleware(DbSessionMiddleware())
+dp.update.outer_middleware(dp.fsm)
 dp.include_router(router)
+pipeline = DeliveryPipeline(
+    bot,
+    on_sent=on_delivery_sent,
+    on_failed=on_delivery_failed,
+    on_unavailable=on_chat_unavailable,
+    workers=DELIVERY_WORKERS,
+    queue_size=DELIVERY_QUEUE_SIZE,
+    global_rate=DELIVERY_GLOBAL_RATE,
+    chat_rate=DELIVERY_CHAT_RATE,
+    chat_burst=DELIVERY_CHAT_BURST,
+    max_retries=DELIVERY_MAX_RETRIES
+)
 
 async def on_startup(app):
-    await init_db()
+    await check_schema()
+    if DB_POOL_WARM:
+        await warm_pool(DB_POOL_WARM)
+        logger.info("Pool warmed", extra=pool_stats())
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
     dp.message.middleware(RegistrationMiddleware())
     dp.callback_query.middleware(RegistrationMiddleware())
-    asyncio.create_task(reminder_cleaner(bot))
+    pipeline.start()
+    start_background(reminder_cleaner(pipeline))
+    start_background(lease_renewer(pipeline))
+    if isinstance(storage, DatabaseStorage):
+        start_background(fsm_purger(storage))
+    if replica is not None:
+        start_background(replica_monitor())
     await bot.set_webhook(WEBHOOK_URL)
 
 async def on_shutdown(app):
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    await pipeline.stop()
     await bot.delete_webhook()
-    print("[Webhook] Удалён")
+    logger.info("Webhook deleted")
 
 def create_app():
     app = web.Application()
     app.on_startup.append(on_startup)
     app.on_shutdown.append(on_shutdown)
 
-    SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=WEBHOOK_PATH)
+    if WEBHOOK_INGESTION == "queue":
+        handler = QueuedRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            workers=WEBHOOK_WORKERS,
+            queue_size=WEBHOOK_QUEUE_SIZE,
+            dedup_size=WEBHOOK_DEDUP_SIZE
+        )
+        metrics.registry.register(metrics.Gauge("webhook_queue_size", "Updates waiting for a worker", handler.qsize))
+    else:
+        handler = SimpleRequestHandler(dispatcher=dp, bot=bot)
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/metrics", metrics.metrics_handler)
     setup_application(app, dp, bot=bot)
     return app
 
 if __name__ == '__main__':
-    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATE, LOG_FORMAT)
     web.run_app(create_app(), host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
 
@@ -0,0 +1,168 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+
+class Gauge:
+    # значение снимается в момент скрейпа
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {self.collect()}"
+
+
+class ObservedCounter(Gauge):
+    # монотонный счётчик, который ведёт сам объект (кэш, реплика); тоже снимается в момент скрейпа
+    kind = "counter"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # label values -> [counts по бакетам..., +Inf, sum]
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {series[-1]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+delivery_lag = registry.register(Histogram(
+    "reminder_delivery_lag_seconds", "Time between reminder_time and a successful send", buckets=LAG_BUCKETS
+))
+deliveries = registry.register(Counter(
+    "reminder_deliveries_total", "Delivery outcomes", labels=("result",)
+))
+cleaner_tick = registry.register(Histogram(
+    "reminder_cleaner_tick_seconds", "Duration of a reminder_cleaner claim pass"
+))
+cleaner_due = registry.register(Histogram(
+    "reminder_cleaner_due_reminders", "Due reminders claimed per reminder_cleaner pass",
+    buckets=(0, 1, 10, 50, 100, 500, 1000, 5000)
+))
+handler_latency = registry.register(Histogram(
+    "handler_latency_seconds", "Update handler latency", labels=("handler",)
+))
+db_queries = registry.register(Histogram(
+    "db_query_seconds", "SQL statement execution time"
+))
+bot_api_latency = registry.register(Histogram(
+    "bot_api_request_seconds", "Bot API request latency", labels=("method",)
+))
+bot_api_errors = registry.register(Counter(
+    "bot_api_errors_total", "Bot API request errors", labels=("method", "error")
+))
+webhook_updates = registry.register(Counter(
+    "webhook_updates_total", "Incoming webhook updates by outcome", labels=("result",)
+))
+flood_rejected = registry.register(Counter(
+    "flood_rejected_total", "Updates dropped by flood protection", labels=("scope",)
+))
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_queries.observe(time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            bot_api_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            bot_api_latency.observe(time.perf_counter() - started, name)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
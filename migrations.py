@@ -0,0 +1,164 @@
+"""Версионированные миграции схемы.
+
+Запускаются один раз на релиз (release-фаза в Procfile), а не при каждом старте процесса:
+
+    python migrations.py
+
+Каждая миграция идемпотентна (проверяет схему через inspector) и применяется в своей транзакции
+вместе с записью в schema_migrations. Новые миграции только добавляются в конец MIGRATIONS.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from database import Base, Reminder, SchemaMigration, engine
+
+logger = logging.getLogger("migrations")
+
+# ключ pg_advisory_xact_lock: два релиза не применяют одну миграцию одновременно
+LOCK_KEY = 7_310_021
+
+
+def _add_column(conn, table: str, name: str, ddl: str):
+    if name not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _create_index(conn, table, name: str):
+    # описание индекса берём из модели; IF NOT EXISTS проверяет сама база —
+    # список индексов из inspector у SQLite бывает устаревшим на соединении из пула
+    conn.execute(CreateIndex(next(i for i in table.indexes if i.name == name), if_not_exists=True))
+
+
+def _drop_index(conn, name: str):
+    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def _rebuild_sqlite_table(conn, table):
+    # SQLite не меняет ограничения столбца через ALTER: пересоздаём таблицу по модели и копируем строки
+    old = f"{table.name}_old"
+    for index in inspect(conn).get_indexes(table.name):
+        _drop_index(conn, index["name"])
+    conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {old}"))
+    table.create(conn)
+    columns = ", ".join(c.name for c in table.columns)
+    conn.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}"))
+    conn.execute(text(f"DROP TABLE {old}"))
+
+
+def initial_tables(conn):
+    # новая база получает схему целиком, в существующей create_all ничего не трогает
+    Base.metadata.create_all(conn)
+
+
+def reminder_delivery_columns(conn):
+    _add_column(conn, "reminders", "next_attempt_at", "TIMESTAMP WITH TIME ZONE")
+    _add_column(conn, "reminders", "claimed_by", "VARCHAR")
+    _add_column(conn, "reminders", "status", "VARCHAR NOT NULL DEFAULT 'pending'")
+    _add_column(conn, "reminders", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "reminders", "last_error", "VARCHAR")
+    conn.execute(text("UPDATE reminders SET next_attempt_at = reminder_time WHERE next_attempt_at IS NULL"))
+
+
+def reminder_recurrence(conn):
+    _add_column(conn, "reminders", "recurrence", "VARCHAR")
+
+
+def user_digest_and_activity(conn):
+    _add_column(conn, "users", "digest_window", "INTEGER")
+    _add_column(conn, "users", "is_active", "BOOLEAN NOT NULL DEFAULT true")
+
+
+def reminder_indexes(conn):
+    reminders = Reminder.__table__
+    # список пользователя и выборка к отправке без последовательного сканирования
+    _create_index(conn, reminders, "ix_reminders_user_time")
+    _create_index(conn, reminders, "ix_reminders_reminder_time")
+    _create_index(conn, reminders, "ix_reminders_due")
+    # полный индекс по next_attempt_at заменён частичным ix_reminders_due
+    _drop_index(conn, "ix_reminders_next_attempt_at")
+
+
+def reminder_next_attempt_not_null(conn):
+    # миграция 2 добавляла столбец без NOT NULL: обновлённые базы расходились со схемой новых
+    conn.execute(text("UPDATE reminders SET next_attempt_at = reminder_time WHERE next_attempt_at IS NULL"))
+    column = next(c for c in inspect(conn).get_columns("reminders") if c["name"] == "next_attempt_at")
+    if not column["nullable"]:
+        return
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE reminders ALTER COLUMN next_attempt_at SET NOT NULL"))
+    else:
+        _rebuild_sqlite_table(conn, Reminder.__table__)
+
+
+MIGRATIONS = [
+    (1, initial_tables),
+    (2, reminder_delivery_columns),
+    (3, reminder_recurrence),
+    (4, user_digest_and_activity),
+    (5, reminder_indexes),
+    (6, reminder_next_attempt_not_null),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def _applied(conn) -> set:
+    await conn.run_sync(lambda sync_conn: SchemaMigration.__table__.create(sync_conn, checkfirst=True))
+    return set((await conn.execute(select(SchemaMigration.version))).scalars())
+
+
+async def migrate() -> int:
+    async with engine.begin() as conn:
+        applied = await _applied(conn)
+    count = 0
+    for version, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+                # пока ждали блокировку, миграцию мог применить другой процесс
+                if await conn.scalar(select(SchemaMigration.version).where(SchemaMigration.version == version)):
+                    continue
+            started = datetime.now(timezone.utc)
+            await conn.run_sync(migration)
+            await conn.execute(SchemaMigration.__table__.insert().values(
+                version=version, name=migration.__name__, applied_at=datetime.now(timezone.utc)
+            ))
+        count += 1
+        logger.info("Migration applied", extra={
+            "version": version, "migration": migration.__name__,
+            "seconds": (datetime.now(timezone.utc) - started).total_seconds()
+        })
+    return count
+
+
+async def check_schema():
+    # при старте только сверяем версию: миграции не должны выполняться на каждом запуске процесса
+    async with engine.connect() as conn:
+        if not await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(SchemaMigration.__tablename__)):
+            pending = [version for version, _ in MIGRATIONS]
+        else:
+            applied = set((await conn.execute(select(SchemaMigration.version))).scalars())
+            pending = [version for version, _ in MIGRATIONS if version not in applied]
+    if pending:
+        raise RuntimeError(f"Database schema is behind: pending migrations {pending}, run `python migrations.py`")
+
+
+if __name__ == "__main__":
+    from config import LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATE, LOG_FORMAT
+    from logs import setup_logging
+
+    setup_logging(LOG_LEVEL, LOG_LEVELS, LOG_SAMPLE_RATE, LOG_FORMAT)
+
+    async def main():
+        try:
+            applied = await migrate()
+            logger.info("Schema up to date", extra={"version": LATEST_VERSION, "applied": applied})
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
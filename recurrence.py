@@ -0,0 +1,147 @@
+import re
+from datetime import datetime, timedelta, tzinfo
+from typing import Optional
+
+# Правило повтора хранится в reminders.recurrence строкой:
+#   daily            — каждый день в то же местное время
+#   weekly:0,2,4     — по дням недели (0 = понедельник) в то же местное время
+#   hours:6          — каждые N часов
+#   cron:0 9 * * 1-5 — cron из пяти полей в часовом поясе пользователя
+# NULL — разовое напоминание, после отправки удаляется.
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+CRON_SEARCH_DAYS = 366 * 5
+
+
+def _parse_weekdays(text: str) -> list:
+    days = set()
+    for part in re.split(r"[,\s]+", text.strip().lower()):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = (WEEKDAYS.index(p[:3]) for p in part.split("-", 1))
+            days.update(range(first, last + 1))
+        elif part[:3] in WEEKDAYS:
+            days.add(WEEKDAYS.index(part[:3]))
+        else:
+            raise ValueError(f"Unknown weekday: {part}")
+    if not days:
+        raise ValueError("No weekdays given")
+    return sorted(days)
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> frozenset:
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+            if step < 1:
+                raise ValueError(f"Bad cron step: {field}")
+        if part == "*":
+            first, last = low, high
+        elif "-" in part:
+            first, last = (int(p) for p in part.split("-", 1))
+        else:
+            first = last = int(part)
+        if first < low or last > high or first > last:
+            raise ValueError(f"Cron value out of range: {field}")
+        values.update(range(first, last + 1, step))
+    return frozenset(values)
+
+
+def _parse_cron(expression: str):
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError("Cron needs 5 fields: minute hour day month weekday")
+    minutes, hours, days, months, weekdays = (
+        _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+    )
+    # в cron воскресенье это 0 и 7, переводим в datetime.weekday()
+    weekdays = frozenset((d - 1) % 7 for d in weekdays)
+    return minutes, hours, days, months, weekdays, fields[2] != "*", fields[4] != "*"
+
+
+def parse_rule(text: str, first_time: datetime) -> Optional[str]:
+    # пользовательский ввод -> нормализованное правило; None — без повтора
+    value = " ".join(text.strip().lower().split())
+    if value in ("once", "no", "none", "-", "never"):
+        return None
+    if value in ("daily", "every day"):
+        return "daily"
+    if value == "weekdays":
+        return "weekly:0,1,2,3,4"
+    if value == "weekly":
+        return f"weekly:{first_time.weekday()}"
+    if value.startswith("weekly "):
+        return "weekly:" + ",".join(str(d) for d in _parse_weekdays(value[len("weekly "):]))
+    match = re.fullmatch(r"every (\d+) ?(h|hour|hours)", value)
+    if match:
+        hours = int(match.group(1))
+        if not 1 <= hours <= 24 * 31:
+            raise ValueError("Hours must be between 1 and 744")
+        return f"hours:{hours}"
+    if value.startswith("cron "):
+        expression = value[len("cron "):]
+        _parse_cron(expression)
+        return f"cron:{expression}"
+    raise ValueError(f"Unknown repeat rule: {text}")
+
+
+def describe(rule: Optional[str]) -> str:
+    if not rule:
+        return "once"
+    kind, _, arg = rule.partition(":")
+    if kind == "daily":
+        return "daily"
+    if kind == "weekly":
+        return "weekly on " + ", ".join(WEEKDAYS[int(d)].capitalize() for d in arg.split(","))
+    if kind == "hours":
+        return f"every {arg} hours"
+    return f"cron {arg}"
+
+
+def next_occurrence(rule: str, previous: datetime, tz: tzinfo, after: datetime) -> Optional[datetime]:
+    # ближайшее срабатывание строго позже after; previous задаёт местное время суток для daily/weekly
+    kind, _, arg = rule.partition(":")
+    if kind == "hours":
+        period = timedelta(hours=int(arg))
+        skipped = max(1, (after - previous) // period + 1)
+        return previous + skipped * period
+    local_after = after.astimezone(tz)
+    if kind in ("daily", "weekly"):
+        weekdays = set(range(7)) if kind == "daily" else {int(d) for d in arg.split(",")}
+        local_previous = previous.astimezone(tz)
+        day = max(local_previous.date() + timedelta(days=1), local_after.date())
+        for _ in range(8):
+            candidate = datetime.combine(day, local_previous.timetz())
+            if candidate.weekday() in weekdays and candidate > after:
+                return candidate
+            day += timedelta(days=1)
+        return None
+    if kind == "cron":
+        return _next_cron(arg, tz, max(after, previous))
+    raise ValueError(f"Unknown repeat rule: {rule}")
+
+
+def _next_cron(expression: str, tz: tzinfo, after: datetime) -> Optional[datetime]:
+    minutes, hours, days, months, weekdays, days_set, weekdays_set = _parse_cron(expression)
+    start = after.astimezone(tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    day = start.date()
+    # перебираем дни, а не минуты: не дольше нескольких тысяч итераций даже для «29 февраля»
+    for _ in range(CRON_SEARCH_DAYS):
+        if day.month in months:
+            day_match = day.day in days
+            weekday_match = day.weekday() in weekdays
+            # как в cron: если заданы оба поля, достаточно совпадения любого
+            matched = day_match or weekday_match if days_set and weekdays_set else day_match and weekday_match
+            if matched:
+                for hour in sorted(hours):
+                    for minute in sorted(minutes):
+                        candidate = start.replace(year=day.year, month=day.month, day=day.day, hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+        day += timedelta(days=1)
+    return None
@@ -0,0 +1,149 @@
+"""Проверка чтений с реплики на двух живых базах: primary и его потоковой standby-реплике.
+
+По шагам проверяет:
+- sticky: сразу после записи список пользователя читается с primary, даже если реплика отстаёт;
+- чтение с реплики: после sticky-окна список идёт на реплику и видит её (устаревшие) данные;
+- кэш страницы с реплики: держится не дольше REPLICA_MAX_LAG, потом список перечитывается;
+- отставание: при лаге больше REPLICA_MAX_LAG проверка здоровья выключает реплику и чтения уходят на primary,
+  после догона реплика возвращается.
+
+Отставание создаётся паузой воспроизведения WAL на реплике (pg_wal_replay_pause), нужен суперпользователь:
+
+    DATABASE_URL=postgresql+asyncpg://postgres@localhost:5432/reminders \
+    DATABASE_REPLICA_URL=postgresql+asyncpg://postgres@localhost:5433/reminders python replica_check.py
+
+ВНИМАНИЕ: таблицы в базе пересоздаются.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("BOT_TOKEN", "123456:REPLICACHECK")
+os.environ.setdefault("APP_URL", "http://localhost")
+# короткие окна, чтобы проверка шла секунды, а не минуты
+os.environ.setdefault("REPLICA_STICKY_SECONDS", "1")
+os.environ.setdefault("REPLICA_MAX_LAG", "2")
+
+from sqlalchemy import text
+
+from config import REPLICA_STICKY_SECONDS, REPLICA_MAX_LAG
+from database import (
+    Base, engine, replica, unit_of_work,
+    create_or_update_user, create_user_remind, get_reminders_page, get_user_context
+)
+from handlers import get_reminders_list
+from migrations import migrate
+
+TELEGRAM_ID = 30_000_000
+
+
+async def replay(paused: bool):
+    async with replica.engine.connect() as conn:
+        await conn.execute(text("SELECT pg_wal_replay_pause()" if paused else "SELECT pg_wal_replay_resume()"))
+
+
+async def caught_up(timeout: float = 30):
+    # реплика догнала primary: его текущая позиция WAL уже воспроизведена
+    async with engine.connect() as conn:
+        lsn = await conn.scalar(text("SELECT pg_current_wal_lsn()::text"))
+    deadline = time.monotonic() + timeout
+    async with replica.engine.connect() as conn:
+        while time.monotonic() < deadline:
+            if await conn.scalar(text(f"SELECT pg_last_wal_replay_lsn() >= '{lsn}'::pg_lsn")):
+                return
+            await asyncio.sleep(0.1)
+    raise TimeoutError("replica did not catch up")
+
+
+async def add_reminder(user_id: int, title: str):
+    async with unit_of_work() as session:
+        await create_user_remind(session, user_id, title, datetime.now(timezone.utc) + timedelta(days=1), "replica check")
+
+
+async def titles(user_id: int):
+    async with unit_of_work() as session:
+        page = await get_reminders_page(session, user_id, 100)
+    return [r["title"] for r in page.reminders], page.from_replica
+
+
+async def rendered(user_ctx):
+    async with unit_of_work() as session:
+        text_, _ = await get_reminders_list(session, user_ctx)
+    return text_
+
+
+async def run() -> dict:
+    results = {}
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await migrate()
+    async with unit_of_work() as session:
+        user = await create_or_update_user(session, TELEGRAM_ID, "0")
+    await add_reminder(user.id, "first")
+    await caught_up()
+    await asyncio.sleep(REPLICA_STICKY_SECONDS)
+    async with unit_of_work() as session:
+        user_ctx = await get_user_context(session, TELEGRAM_ID)
+
+    # sticky: реплика стоит, запись только что была — читаем свою запись с primary
+    await replay(paused=True)
+    try:
+        await add_reminder(user.id, "second")
+        seen, from_replica = await titles(user.id)
+        results["sticky_reads_primary"] = not from_replica and "second" in seen
+
+        # sticky-окно прошло — чтение уходит на отстающую реплику и видит старый список
+        await asyncio.sleep(REPLICA_STICKY_SECONDS + 0.1)
+        seen, from_replica = await titles(user.id)
+        results["reads_replica_after_sticky"] = from_replica and seen == ["first"]
+        stale = await rendered(user_ctx)
+        cached_at = time.monotonic()
+    finally:
+        await replay(paused=False)
+    await caught_up()
+
+    # реплика догнала, но закэшированная с неё страница живёт до REPLICA_MAX_LAG
+    results["replica_page_cached"] = await rendered(user_ctx) == stale and time.monotonic() - cached_at < REPLICA_MAX_LAG
+    await asyncio.sleep(max(0.0, REPLICA_MAX_LAG - (time.monotonic() - cached_at)) + 0.1)
+    results["replica_page_expires"] = "second" in await rendered(user_ctx)
+
+    # отставание больше REPLICA_MAX_LAG — проверка здоровья уводит чтения на primary
+    await replay(paused=True)
+    try:
+        await add_reminder(user.id, "third")
+        await asyncio.sleep(REPLICA_MAX_LAG + 0.5)
+        await replica.check()
+        results["lag_seconds"] = round(replica.lag, 2)
+        results["lagging_replica_unhealthy"] = not replica.healthy
+        seen, from_replica = await titles(user.id)
+        results["lag_falls_back_to_primary"] = not from_replica and "third" in seen
+    finally:
+        await replay(paused=False)
+    await caught_up()
+    await replica.check()
+    results["replica_recovers"] = replica.healthy
+    seen, from_replica = await titles(user.id)
+    results["reads_replica_after_recovery"] = from_replica and "third" in seen
+
+    await replica.engine.dispose()
+    await engine.dispose()
+    return results
+
+
+def main():
+    if replica is None or engine.dialect.name != "postgresql" or replica.engine.dialect.name != "postgresql":
+        sys.exit("[ReplicaCheck] DATABASE_URL and DATABASE_REPLICA_URL must point to a Postgres primary and its standby")
+    results = asyncio.run(run())
+    print(json.dumps(results, indent=2))
+    failed = [name for name, ok in results.items() if ok is False]
+    if failed:
+        print(f"[ReplicaCheck] FAILED: {', '.join(failed)}")
+        sys.exit(1)
+    print("[ReplicaCheck] OK")
+
+
+if __name__ == "__main__":
+    main()
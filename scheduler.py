@@ -0,0 +1,97 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from config import SCHEDULER_HORIZON, SCHEDULER_RESYNC_INTERVAL
+from database import get_upcoming_reminders
+
+logger = logging.getLogger("scheduler")
+
+
+class ReminderScheduler:
+    def __init__(self, horizon: float, resync_interval: float):
+        self.horizon = timedelta(seconds=horizon)
+        self.resync_interval = resync_interval
+        self._heap = []   # (reminder_time, reminder_id), устаревшие записи удаляются лениво
+        self._times = {}  # reminder_id -> актуальное reminder_time
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._times)
+
+    def schedule(self, reminder_id: int, reminder_time: datetime):
+        if reminder_time.tzinfo is None:
+            reminder_time = reminder_time.replace(tzinfo=timezone.utc)
+        if reminder_time > datetime.now(timezone.utc) + self.horizon:
+            # за горизонтом — подхватится при следующей синхронизации
+            self.cancel(reminder_id)
+            return
+        self._times[reminder_id] = reminder_time
+        heapq.heappush(self._heap, (reminder_time, reminder_id))
+        self._wakeup.set()
+
+    def cancel(self, reminder_id: int):
+        self._times.pop(reminder_id, None)
+        if len(self._heap) > 2 * len(self._times) + 64:
+            self._rebuild()
+
+    async def resync(self):
+        rows = await get_upcoming_reminders(datetime.now(timezone.utc) + self.horizon)
+        self._times = {row.id: row.next_attempt_at for row in rows}
+        self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [(reminder_time, reminder_id) for reminder_id, reminder_time in self._times.items()]
+        heapq.heapify(self._heap)
+
+    def _next_due(self):
+        while self._heap:
+            reminder_time, reminder_id = self._heap[0]
+            if self._times.get(reminder_id) == reminder_time:
+                return reminder_time
+            heapq.heappop(self._heap)
+        return None
+
+    def _pop_due(self, now: datetime):
+        while self._heap and self._heap[0][0] <= now:
+            reminder_time, reminder_id = heapq.heappop(self._heap)
+            if self._times.get(reminder_id) == reminder_time:
+                del self._times[reminder_id]
+
+    async def run(self, deliver: Callable[[], Awaitable[None]]):
+        loop = asyncio.get_running_loop()
+        # база недоступна при старте — доставка не умирает, следующая попытка на очередном resync
+        try:
+            await self.resync()
+        except Exception:
+            logger.exception("Resync failed")
+        next_sync = loop.time() + self.resync_interval
+        while True:
+            self._wakeup.clear()
+            now = datetime.now(timezone.utc)
+            next_due = self._next_due()
+            if next_due is not None and next_due <= now:
+                self._pop_due(now)
+                try:
+                    await deliver()
+                except Exception:
+                    logger.exception("Delivery failed")
+                continue
+            timeout = next_sync - loop.time()
+            if next_due is not None:
+                timeout = min(timeout, (next_due - now).total_seconds())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+            if loop.time() >= next_sync:
+                try:
+                    await self.resync()
+                except Exception:
+                    logger.exception("Resync failed")
+                next_sync = loop.time() + self.resync_interval
+
+
+scheduler = ReminderScheduler(SCHEDULER_HORIZON, SCHEDULER_RESYNC_INTERVAL)
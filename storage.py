@@ -0,0 +1,106 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, func, select
+
+from database import async_session, current_session, FsmState
+
+
+class DatabaseStorage(BaseStorage):
+    # одна строка на ключ; брошенные сценарии истекают через ttl и вычищаются purge_expired
+    def __init__(self, ttl: float):
+        self.ttl = timedelta(seconds=ttl)
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+
+    async def _write(self, session, key: StorageKey, values: Dict[str, Any]):
+        storage_key = self.key_builder.build(key)
+        now = datetime.now(timezone.utc)
+        row = await session.get(FsmState, storage_key)
+        if row is None:
+            row = FsmState(key=storage_key)
+            session.add(row)
+        elif row.expires_at <= now:
+            row.state = row.data = None
+        for name, value in values.items():
+            setattr(row, name, value)
+        if row.state is None and row.data is None:
+            if row in session.new:
+                session.expunge(row)
+                return
+            await session.delete(row)
+        else:
+            row.expires_at = now + self.ttl
+
+    async def _save(self, key: StorageKey, **values):
+        session = current_session.get()
+        if session is not None:
+            # внутри апдейта пишем в его транзакцию: коммит один на апдейт, а SQLite не ждёт сам себя
+            await self._write(session, key, values)
+            return
+        async with async_session() as session:
+            await self._write(session, key, values)
+            await session.commit()
+
+    async def _read(self, session, key: StorageKey):
+        result = await session.execute(
+            select(FsmState.state, FsmState.data).where(
+                FsmState.key == self.key_builder.build(key),
+                FsmState.expires_at > datetime.now(timezone.utc)
+            )
+        )
+        return result.first()
+
+    async def _load(self, key: StorageKey):
+        session = current_session.get()
+        if session is not None:
+            return await self._read(session, key)
+        async with async_session() as session:
+            return await self._read(session, key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._save(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        row = await self._load(key)
+        return row.state if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._save(key, data=json.dumps(dict(data), separators=(",", ":")) if data else None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._load(key)
+        return json.loads(row.data) if row and row.data else {}
+
+    async def purge_expired(self) -> int:
+        async with async_session() as session:
+            result = await session.execute(
+                delete(FsmState).where(FsmState.expires_at <= datetime.now(timezone.utc))
+            )
+            await session.commit()
+            return result.rowcount
+
+    async def stats(self) -> Dict[str, int]:
+        async with async_session() as session:
+            result = await session.execute(
+                select(func.count(), func.coalesce(func.sum(func.length(FsmState.data)), 0))
+            )
+            keys, size = result.one()
+            return {"keys": keys, "bytes": size}
+
+    async def close(self) -> None:
+        pass
+
+
+def create_storage(kind: str, ttl: float, redis_url: str = None) -> BaseStorage:
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage  # нужен пакет redis
+        return RedisStorage.from_url(redis_url, state_ttl=int(ttl), data_ttl=int(ttl))
+    if kind == "database":
+        return DatabaseStorage(ttl)
+    raise ValueError(f"Unknown FSM_STORAGE: {kind}")
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+import metrics
+
+logger = logging.getLogger("webhook")
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    # апдейт содержит ровно один объект помимо update_id; чат ищем в нём или во вложенном message
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        if value.get("from"):
+            return value["from"]["id"]
+    return 0
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    # отвечаем Telegram сразу, апдейт обрабатывается воркером;
+    # очередь на воркер своя, чат всегда попадает в одну и ту же — порядок внутри чата сохраняется
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, workers: int, queue_size: int, dedup_size: int, **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, **data)
+        self.queues = [asyncio.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self.dedup_size = dedup_size
+        self._seen = OrderedDict()  # update_id -> None, LRU недавно принятых апдейтов
+        self._workers = []
+
+    def register(self, app: web.Application, /, path: str, **kwargs: Any) -> None:
+        app.on_startup.append(self._start)
+        super().register(app, path=path, **kwargs)
+
+    async def _start(self, app: web.Application):
+        self._workers = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def _is_duplicate(self, update_id: int) -> bool:
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            return True
+        return False
+
+    def _remember(self, update_id: int):
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        update_id = update.get("update_id")
+        if self._is_duplicate(update_id):
+            metrics.webhook_updates.inc("duplicate")
+            return web.json_response({}, dumps=bot.session.json_dumps)
+        queue = self.queues[hash(update_chat_id(update)) % len(self.queues)]
+        try:
+            queue.put_nowait((bot, update))
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже; в памяти не копим
+            metrics.webhook_updates.inc("rejected")
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        self._remember(update_id)
+        metrics.webhook_updates.inc("accepted")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            bot, update = await queue.get()
+            try:
+                await self._background_feed_update(bot=bot, update=update)
+            except Exception:
+                logger.exception("Update processing failed", extra={"update_id": update.get("update_id")})
+            finally:
+                queue.task_done()
+
+    async def close(self) -> None:
+        # дорабатываем уже принятые апдейты, Telegram их повторно не пришлёт
+        await asyncio.gather(*(queue.join() for queue in self.queues))
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await super().close()